@@ -1,267 +1,697 @@
-
-from collections import Counter, defaultdict
+import bisect
+import heapq
+from collections import defaultdict, deque
 
 import constants as C
 import extendedast as ext
 import x86ir as x86
+from dataflow import iter_livenesses, solve_liveness, step_before
 
 
 NOT_MEM = -1
 
-
-def allocate_memory(statements, func_args=None):
-    success = False
-    while not success:
-        graph = interference_graph(statements)
+REGALLOCS = ('graph', 'linear')
+MAX_COLORING_ROUNDS = 4
+LINEAR_SCAN_SCRATCH = C.N_REGS - 1  # %edi, loads spilled operands
+
+
+class InterferenceGraph:
+    # The variables of a function are interned to dense ids (after the
+    # registers, so that the id of a register is its color), and sets of
+    # variables (live sets, neighbors) are int bitsets over these ids.
+
+    def __init__(self):
+        self.nodes = list(C.REGS)
+        self.ids = {r: i for i, r in enumerate(C.REGS)}
+        self.edges = [0] * len(self.nodes)
+        self._operands = {}
+        self.merged = {}  # coalesced id: the id it was merged into
+        self.merged_bits = 0
+        self._aliases = {}  # id: the ids merged into it
+        self.moves = []  # the (ids of) moves left, as coloring hints
+        self.across_calls = 0  # the variables live after some call
+
+    def id(self, node):
+        i = self.ids.get(node)
+        if i is None:
+            i = self.ids[node] = len(self.nodes)
+            self.nodes.append(node)
+            self.edges.append(0)
+        return i
+
+    def bits(self, args):
+        # of the variables among args
+        bits = 0
+        for arg in args:
+            if isinstance(arg, ext.Name):
+                bits |= 1 << self.id(arg)
+        return bits
+
+    def operands(self, inst, update=False):
+        # (read, written) ids of an instruction, which unlike their bits stay
+        # small in large functions
+        key = id(inst)
+        if update or key not in self._operands:
+            # interned in the order of the args, not of the sets (which
+            # depends on the hash seed), as ties of the coloring go by id
+            args = list(dict.fromkeys(inst.args))
+            read, written = inst.read_args(), inst.written_args()
+            self._operands[key] = (
+                tuple(self.id(a) for a in args if a in read),
+                tuple(self.id(a) for a in args if a in written)
+            )
+        return self._operands[key]
+
+    def add_interferences(self, nodes, interfering):
+        # one way only, until close()
+        for node in nodes:
+            self.edges[node] |= interfering
+
+    def close(self):
+        # makes the edges symmetric
+        for node, neighbors in enumerate(self.edges):
+            bit = 1 << node
+            for n in iter_bits(neighbors & ~bit):
+                self.edges[n] |= bit
+            self.edges[node] &= ~bit
+
+    def merge(self, node, into):
+        # coalesces node, which must not interfere with into: its names get
+        # the id into, its neighbors become into's
+        bit = 1 << node
+        for n in iter_bits(self.edges[node]):
+            self.edges[n] = self.edges[n] & ~bit | 1 << into
+        self.edges[into] |= self.edges[node]
+        self.edges[node] = 0
+
+        aliases = self._aliases.pop(node, [])
+        aliases.append(node)
+        for i in aliases:
+            self.ids[self.nodes[i]] = into
+            self.merged[i] = into
+        self.merged_bits |= sum(1 << i for i in aliases)
+        self._aliases.setdefault(into, []).extend(aliases)
+
+    def canonical(self, bits):
+        # of bits computed before some merge
+        for i in iter_bits(bits & self.merged_bits):
+            bits = bits & ~(1 << i) | 1 << self.merged[i]
+        return bits
+
+    def color(self, colors, arg):
+        i = self.ids.get(arg)
+        return NOT_MEM if i is None else colors[i]
+
+
+def iter_bits(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def allocate_memory(cfg, func_args=None, regalloc='graph'):
+    # With graph coloring, liveness and interferences are computed once (or
+    # twice, if the first coloring leads to splitting live ranges around
+    # calls): the temporaries loading spilled operands are added to them
+    # incrementally. If that takes more than MAX_COLORING_ROUNDS, the linear
+    # scan finishes the allocation. Returns cfg, with the locations of the
+    # names, and the size of the spill slots.
+    if regalloc == 'linear':
+        graph = InterferenceGraph()  # only to intern the names
+        colors = linear_scan(cfg, graph, func_args)
+    else:
+        cfg.natural_loops()  # the loop depths of the blocks
+        live = defaultdict(int)
+        graph = interference_graph(cfg, live)
+        coalesced = coalesce_moves(cfg, graph, func_args)
         colors = color_names(graph, func_args)
-        statements, success = try_transform(statements, colors)
-    # print(colors)
-    stack_size = max(0, 4*(max(colors.values()) - C.N_REGS + 1))
-    return statements, stack_size
-
-
-def try_transform(statements, colors):
-    new_statements = []
-    for i, s in enumerate(statements):
-        if isinstance(s, x86.If):
-
-            tcol = colors.get(s.test, NOT_MEM)
-            test = s.test if tcol is NOT_MEM else get_mem(tcol)
-
-            body, b_success = try_transform(s.body, colors)
-            orelse, o_success = try_transform(s.orelse, colors)
-            if not b_success:
-                statements[i] = x86.If(s.test, body, s.orelse)
-            elif not o_success:
-                statements[i] = x86.If(s.test, s.body, orelse)
-            else:
-                new_statements.append(x86.If(test, body, orelse))
-                continue  # avoid returning
-            return statements, False
-
-        elif isinstance(s, x86.While):
-
-            tcol = colors.get(s.test, NOT_MEM)
-            test = s.test if tcol is NOT_MEM else get_mem(tcol)
-
-            tasm, t_success = try_transform(s.tasm, colors)
-            body, b_success = try_transform(s.body, colors)
-            if not t_success:
-                statements[i] = x86.While(tasm, s.test, s.body)
-            elif not b_success:
-                statements[i] = x86.While(s.tasm, s.test, body)
-            else:
-                new_statements.append(x86.While(tasm, test, body))
-                continue  # avoid returning
-            return statements, False
 
+        renamed, splits = split_around_calls(cfg, colors, graph)
+        if renamed:
+            live = defaultdict(int)
+            graph = interference_graph(cfg, live)
+            coalesced = coalesce_moves(cfg, graph, func_args, splits)
+            colors = color_names(graph, func_args)
+        remove_moves(cfg, coalesced)
+
+        for _ in range(MAX_COLORING_ROUNDS):
+            if not fix_memory_operands(cfg, colors, live, graph):
+                break
+            colors = color_names(graph, func_args)
         else:
-            arg_colors = [colors.get(a, NOT_MEM) for a in s.args]
-            if sum((n < -1 or n >= C.N_REGS) for n in arg_colors) >= 2:
-                # handle multi-spilling (x86 only allows 1 mem-access / instr.)
+            colors = linear_scan(cfg, graph, func_args)
+    # print(colors)
+    stack_size = max(0, 4*(max(colors) - C.N_REGS + 1))
+    assign_locations(cfg, colors, graph)
+    return cfg, stack_size
+
+
+def fix_memory_operands(cfg, colors, live, graph):
+    # x86 only allows 1 mem-access / instr., so every other spilled operand is
+    # first moved to an unspillable (in place, for all the instructions at
+    # once). Returns how many were needed.
+    n_fixed = 0
+    for block in cfg.blocks:
+        statements = block.stmts
+        i = 0
+        while i < len(statements):
+            s = statements[i]
+            spilled = [
+                j for j, a in enumerate(s.args)
+                if in_memory(graph.color(colors, a))
+            ]
+            for j in spilled[:-1]:
                 tmp = _new_unspillable()
-                spill_index = next(
-                    i for i, n in enumerate(arg_colors)
-                    if n < NOT_MEM or n >= C.N_REGS
+                load = x86.Mov(s.args[j], tmp)  # save spilled
+                s.args[j] = tmp  # swap spilled with saved value
+
+                # tmp is only live from load to s
+                l_before = step_before(
+                    graph.canonical(live[id(s)]),
+                    graph.operands(s, update=True)
                 )
+                t = graph.id(tmp)
+                interfering = l_before & ~graph.bits(load.args)
+                graph.add_interferences([t], interfering)
+                graph.add_interferences(iter_bits(interfering), 1 << t)
+
+                statements.insert(i, load)
+                i += 1
+                n_fixed += 1
+            i += 1
+    return n_fixed
 
-                # old_s = repr(s)
 
-                spilled_arg = s.args[spill_index]
-                statements.insert(i, x86.Mov(spilled_arg, tmp))  # save spilled
-                s.args[spill_index] = tmp  # swap spilled with saved value
+def assign_locations(cfg, colors, graph):
+    # in place, but copying the instructions
+    def location(arg):
+        color = graph.color(colors, arg)
+        # if not variable, keep same, else get_mem
+        return arg if color == NOT_MEM else get_mem(color)
 
-                # print("spill-handled {} -> {}; {}".format(
-                #     old_s, repr(statements[i]), repr(s)
-                # ))
+    for block in cfg.blocks:
+        new_statements = []
+        for s in block.stmts:
+            s = x86.X86Instruction.copy(s)
+            s.args = [location(a) for a in s.args]
+            new_statements.append(s)
+        block.stmts = new_statements
+        if block.test is not None:
+            block.test = location(block.test)
 
-                return statements, False
-            else:
-                s = x86.X86Instruction.copy(s)
-                s.args = [
-                    # if not variable, keep same, else get_mem
-                    s.args[i] if c is NOT_MEM else get_mem(c)
-                    for i, c in enumerate(arg_colors)
-                ]
-                new_statements.append(s)
-    return new_statements, True
+
+def in_memory(color):
+    return color < NOT_MEM or color >= C.N_REGS
 
 
 def get_mem(color):
+    # spill slots are right below %ebp, wrap_function saves the callee save
+    # registers below them
     return "{}(%ebp)".format(-4*(color)) if color < -1 else (
             C.REGS[color] if color < C.N_REGS else
             "{}(%ebp)".format(-4*(color - C.N_REGS + 1))
     )
 
 
-def color_names(graph, func_args=None):
-    saturations = Counter({n: 0 for n in graph if isinstance(n, ext.Name)})
-    for r in C.CSAVE_REGS:
-        saturations.update(graph[r])
-
-    colors = defaultdict(lambda: NOT_MEM)
-    for i, r in enumerate(C.REGS):
-        colors[r] = i
-
-    func_args = func_args or []
-    for i, name in enumerate(func_args):
-        arg = ext.Name(name)
-        colors[arg] = - i - 2
-        update_uncolored_neighbors(saturations, colors, graph, arg)
-        saturations[arg] = -1
-
-    while saturations:
-        common = saturations.most_common()
-
-        name, sat = common[0]
-        for nnext, snext in common:
-            if sat > snext:
-                break
-            if name.max_color >= nnext.max_color:
-                # switch to the more limited name
-                name, sat = nnext, snext
+def coalesce_moves(cfg, graph, func_args=None, kept=()):
+    # Conservative coalescing, the moves of the innermost loops first: the
+    # operands of a move are merged if they do not interfere and the merged
+    # node is as colorable as before (Briggs: fewer than N_REGS neighbors of
+    # significant degree, George for a register: every neighbor of the name
+    # already interferes with the register or is of insignificant degree).
+    # As precoloring constrains the order of DSatur, a name is only merged
+    # into a register if it is itself of insignificant degree. The moves
+    # left (and those in kept) are coloring hints. Returns the ids of the
+    # coalesced moves, to remove.
+    degrees = [popcount(edges) for edges in graph.edges]
+    func_args = set(func_args or [])
+    fixed = set(  # stack parameters, and names limited to some registers
+        i for node, i in graph.ids.items() if isinstance(node, ext.Name) and (
+            node.max_color != ext.Name.ANY_COLOR or node.id in func_args
+        )
+    )
 
-        if sat < 0:
-            break
+    def significant(n):
+        return n < C.N_REGS or degrees[n] >= C.N_REGS
+
+    def briggs(a, b):
+        neighbors = graph.edges[a] | graph.edges[b]
+        return sum(map(significant, iter_bits(neighbors))) < C.N_REGS
+
+    def george(reg, b):
+        return not significant(b) and all(
+            n < C.N_REGS or graph.edges[reg] >> n & 1 or not significant(n)
+            for n in iter_bits(graph.edges[b])
+        )
+
+    coalesced = set()
+    moves = sorted(loop_moves(cfg), key=lambda m: -m[0])
+    for _, move in moves:
+        if id(move) in kept or not all(a in graph.ids for a in move.args):
+            continue
+        a, b = sorted(graph.ids[a] for a in move.args)
+        if a == b:
+            coalesced.add(id(move))
+        elif (b < C.N_REGS or a in fixed or b in fixed
+              or graph.edges[a] >> b & 1
+              or not (george(a, b) if a < C.N_REGS else briggs(a, b))):
+            graph.moves.append(move.args)
+        else:
+            for n in iter_bits(graph.edges[b] & graph.edges[a]):
+                degrees[n] -= 1
+            graph.merge(b, a)
+            degrees[a] = popcount(graph.edges[a])
+            coalesced.add(id(move))
+
+    graph.moves = [
+        (graph.ids[src], graph.ids[dst]) for src, dst in graph.moves
+        if graph.ids[src] != graph.ids[dst]
+    ]
+    return coalesced
+
+
+def split_around_calls(cfg, colors, graph):
+    # Live range splitting of the names in memory across calls. The runs of
+    # instructions between calls, joined by the control flow, make regions:
+    # a name used enough in a region is renamed there, loaded where the
+    # region is entered (after a call, or at the start of the function) and,
+    # if written in it, stored back where it is left (before a call), when
+    # live there. The new name can then be in a register (caller save ones
+    # too) between the calls, and the loads and stores are outside the loops
+    # without calls. Returns whether any name was renamed (even where no
+    # moves were needed), and the ids of these moves.
+    across_calls = graph.canonical(graph.across_calls)
+    candidates = set(
+        name for name, i in graph.ids.items() if isinstance(name, ext.Name)
+        and across_calls >> i & 1 and in_memory(colors[i])
+    )
+    splits = set()
+    if not candidates:
+        return False, splits
+
+    runs, first_run, last_run = [], {}, {}  # runs are (block, start, end)
+    live_after = {}  # (block, index of a call): variables live after it
+    for block in cfg.blocks:
+        first_run[block], start = len(runs), 0
+        for k, stmt in enumerate(block.stmts):
+            if isinstance(stmt, x86.Call):
+                runs.append((block, start, k))
+                start = k + 1
+        runs.append((block, start, len(block.stmts)))
+        last_run[block] = len(runs) - 1
+
+        l_after = block.live_out | graph.bits([block.test])
+        for k in reversed(range(len(block.stmts))):
+            if isinstance(block.stmts[k], x86.Call):
+                live_after[block, k] = graph.canonical(l_after)
+            l_after = step_before(l_after, graph.operands(block.stmts[k]))
+
+    regions = list(range(len(runs)))  # union-find of the runs
+
+    def region(r):
+        while regions[r] != r:
+            regions[r] = r = regions[regions[r]]
+        return r
+
+    succs = [[] for _ in runs]
+    for block in cfg.blocks:
+        for succ in block.succs:
+            regions[region(last_run[block])] = region(first_run[succ])
+            succs[last_run[block]].append(first_run[succ])
+    dirty = dirty_names(runs, succs, candidates)
+
+    members = defaultdict(list)
+    for r in range(len(runs)):
+        members[region(r)].append(r)
+    inserted = defaultdict(list)  # (block, index): moves to insert before
+    renamed = False
+    for region_runs in members.values():
+        renamed |= split_region(
+            cfg, [runs[r] for r in region_runs],
+            [dirty[r] for r in region_runs], candidates, live_after, graph,
+            inserted
+        )
+
+    for block in cfg.blocks:
+        new_statements = []
+        for k, stmt in enumerate(block.stmts + [None]):
+            for move in inserted.get((block, k), []):
+                new_statements.append(move)
+                splits.add(id(move))
+            if stmt is not None:
+                new_statements.append(stmt)
+        block.stmts = new_statements
+    return renamed, splits
+
+
+def dirty_names(runs, succs, candidates):
+    # forwards, the candidates written in or before each run since the start
+    # of its region (where they would be loaded)
+    dirty = [
+        set(a for s in block.stmts[start:end] for a in s.written_args()
+            if a in candidates)
+        for block, start, end in runs
+    ]
+    worklist = deque(range(len(runs)))
+    while worklist:
+        r = worklist.popleft()
+        for succ in succs[r]:
+            if not dirty[r] <= dirty[succ]:
+                dirty[succ] |= dirty[r]
+                worklist.append(succ)
+    return dirty
+
+
+def split_region(cfg, runs, dirty, candidates, live_after, graph, inserted):
+    # a name is split if its uses outnumber twice the moves it needs (which
+    # are instructions, where a use only saves a memory operand), all
+    # weighted by their loop depth. Returns whether any was.
+    uses = defaultdict(int)
+    for block, start, end in runs:
+        weight = 10 ** block.loop_depth
+        for s in block.stmts[start:end]:
+            for arg in s.args:
+                if arg in candidates:
+                    uses[arg] += weight
+        if end == len(block.stmts) and block.test in candidates:
+            uses[block.test] += weight
+
+    def live(name, bits):
+        return bits >> graph.ids[name] & 1
+
+    entry_live_in = graph.canonical(cfg.entry.live_in)
+    renames = {}
+    for name in sorted(uses, key=str):
+        loads, stores = [], []
+        for (block, start, end), names in zip(runs, dirty):
+            if start > 0 and live(name, live_after[block, start - 1]):
+                loads.append((block, start))
+            elif block is cfg.entry and start == 0 and live(
+                name, entry_live_in
+            ):
+                loads.append((block, start))
+            if (name in names and end < len(block.stmts)
+                    and live(name, live_after[block, end])):
+                stores.append((block, end))
+        cost = sum(10 ** block.loop_depth for block, _ in loads + stores)
+        if uses[name] <= 2 * cost:
+            continue
+
+        renames[name] = temp = _new_split()
+        for point in loads:
+            inserted[point].append(x86.Mov(name, temp))
+        for point in stores:
+            inserted[point].append(x86.Mov(temp, name))
+
+    if renames:
+        for block, start, end in runs:
+            for s in block.stmts[start:end]:
+                rename_names(s, renames)
+            if end == len(block.stmts):
+                block.test = renames.get(block.test, block.test)
+    return bool(renames)
+
+
+def rename_names(s, renames):
+    # in place
+    s.args = [renames.get(a, a) for a in s.args]
+    return s
+
+
+def loop_moves(cfg):
+    # the moves with the loop depth of their block (set by natural_loops)
+    for block in cfg.blocks:
+        for s in block.stmts:
+            if isinstance(s, x86.Mov):
+                yield block.loop_depth, s
+
+
+def remove_moves(cfg, removed):
+    for block in cfg.blocks:
+        block.stmts = [s for s in block.stmts if id(s) not in removed]
 
-        if colors[name] is NOT_MEM:
-            color = best_color(name, colors, graph)
-            colors[name] = color
-            update_uncolored_neighbors(saturations, colors, graph, name)
 
-        saturations[name] = -1  # remove saturations[name]
+def color_names(graph, func_args=None):
+    # DSatur: colors (by id) the name with the most distinct colors among its
+    # neighbors first. Names limited to registers (max_color) go before the
+    # others, then the most limited, the ones with the most neighbors, and
+    # the latest interned one (to be deterministic). The heap keeps stale
+    # entries, skipped when popped. A name takes, if it can, the register of
+    # a name it is moved from or to.
+    n_nodes = len(graph.nodes)
+    colors = [NOT_MEM] * n_nodes
+    used_colors = [0] * n_nodes  # bits of the colors of the neighbors
+    preferred = [0] * n_nodes  # bits of the colors of the move partners
+    saturations = [0] * n_nodes
+    max_colors = [getattr(node, 'max_color', 0) for node in graph.nodes]
+    degrees = [popcount(edges) for edges in graph.edges]
+
+    def priority(node):
+        return (
+            max_colors[node] > C.N_REGS, -saturations[node],
+            max_colors[node], -degrees[node], -node
+        )
+
+    partners = defaultdict(list)
+    for src, dst in graph.moves:
+        partners[src].append(dst)
+        partners[dst].append(src)
+
+    def set_color(node, color):
+        colors[node] = color
+        if color < 0:
+            return  # a stack parameter, not a color of the graph
+        bit = 1 << color
+        if color < C.N_REGS:
+            for n in partners[node]:
+                preferred[n] |= bit
+        for n in iter_bits(graph.edges[node]):
+            if colors[n] == NOT_MEM and not used_colors[n] & bit:
+                used_colors[n] |= bit
+                saturations[n] += 1
+                heapq.heappush(heap, (priority(n), n))
+
+    heap = []
+    for i in range(C.N_REGS):
+        set_color(i, i)
+
+    for i, name in enumerate(func_args or []):
+        arg = graph.ids.get(ext.Name(name))
+        if arg is not None:
+            set_color(arg, - i - 2)
+
+    heap += [
+        (priority(n), n) for n in range(C.N_REGS, n_nodes)
+        if colors[n] == NOT_MEM and n not in graph.merged
+    ]
+    heapq.heapify(heap)
+    while heap:
+        key, name = heapq.heappop(heap)
+        if colors[name] == NOT_MEM and key == priority(name):
+            set_color(name, best_color(
+                used_colors[name], max_colors[name], preferred[name]
+            ))
 
     return colors
 
 
-def update_uncolored_neighbors(saturations, colors, graph, name):
-    saturations.update((
-        n for n in graph[name]
-        if isinstance(n, ext.Name) and colors[n] is NOT_MEM
-    ))
+def best_color(used_colors, max_color=ext.Name.ANY_COLOR, preferred=0):
+    # the lowest preferred register or else color no neighbor uses, or the
+    # lowest stack slot if that is a register the name cannot be in
+    free = ~used_colors
+    hinted = free & preferred
+    if hinted and (hinted & -hinted).bit_length() - 1 < max_color:
+        return (hinted & -hinted).bit_length() - 1
+    color = (free & -free).bit_length() - 1
+    if color >= max_color:
+        free &= ~((1 << C.N_REGS) - 1)
+        color = (free & -free).bit_length() - 1
+    return color
+
 
+def popcount(bits):
+    return bin(bits).count('1')
 
-def best_color(name, colors, graph):
-    color = 0
-    while color in (colors[n] for n in graph[name]):
-        color += 1
-    return color
 
+def interference_graph(cfg, live=None):
+    # also collects in live, if given, the liveness after each instruction that
+    # could need fix_memory_operands
+    graph = InterferenceGraph()
+    csave_regs = [graph.id(r) for r in C.CSAVE_REGS]
+
+    def test_bits(test):
+        return graph.bits([test])
+
+    blocks = cfg.blocks
+    for block in reversed(blocks):
+        # interned backwards, as color_names breaks ties on the latest one
+        for stmt in reversed(block.stmts):
+            graph.operands(stmt)
+    solve_liveness(blocks, graph.operands, test_bits)
 
-def interference_graph(statements):
-    graph = defaultdict(set)
     # print("##########################")
-    for stmt, l_after in iter_livenesses(statements):
+    for stmt, l_after in iter_livenesses(blocks, graph.operands, test_bits):
         # print("{:40.40}".format(str(stmt)), l_after)
-        if isinstance(stmt, C.INSTANTIATING_INSTRUCTIONS):
-            add_interferences(
-                graph, stmt.written_args(), l_after - set(stmt.args)
+        if live is not None and n_variables(stmt) > 1:
+            live[id(stmt)] |= l_after
+        if isinstance(stmt, x86.Mov):
+            # (the source may share the register of the destination)
+            graph.add_interferences(
+                graph.operands(stmt)[1], l_after & ~graph.bits(stmt.args)
             )
+            if stmt.args[0] == ext.Reg('eax'):
+                # the result of a call, which the loads split_around_calls
+                # puts after it must not overwrite
+                graph.add_interferences(
+                    [graph.id(stmt.args[0])], l_after & ~graph.bits(stmt.args)
+                )
         elif isinstance(stmt, x86.Call):
-            add_interferences(graph, C.CSAVE_REGS, l_after)
-        elif isinstance(stmt, C.MODIFYING_INSTRUCTIONS):
-            wargs = stmt.written_args()
-            add_interferences(graph, wargs, l_after - wargs)
+            graph.add_interferences(csave_regs, l_after)
+            graph.across_calls |= l_after
+        elif isinstance(
+            stmt, C.INSTANTIATING_INSTRUCTIONS + C.MODIFYING_INSTRUCTIONS
+        ):
+            graph.add_interferences(
+                graph.operands(stmt)[1],
+                l_after & ~graph.bits(stmt.written_args())
+            )
     # print("############################")
+    graph.close()
     return graph
 
 
-def iter_livenesses(statements, l_after=None):
-    l_after = l_after or set()
-    for stmt in reversed(statements):
-        yield stmt, l_after
-        # Calculate the previous l_after
-        # L_after(k - 1) = (L_after(k) - W(k)) U R(k)
-        if isinstance(stmt, x86.If):
-            for st, la_body in iter_livenesses(stmt.body, set(l_after)):
-                yield st, la_body
-            for st, la_orelse in iter_livenesses(stmt.orelse, set(l_after)):
-                yield st, la_orelse
-            l_after = la_body | la_orelse
-            if isinstance(stmt.test, ext.Name):
-                l_after.add(stmt.test)
-        elif isinstance(stmt, x86.While):
-            # print("====")
-            # print(l_after)
-            for st, l_after in while_livenesses(stmt, l_after):
-                # print(st, l_after)
-                yield st, l_after
-            liveness_step_before(l_after, st)
-            # print("====")
-        else:
-            liveness_step_before(l_after, stmt)
-
-
-def while_livenesses(whl, l_after):
-
-    # Consider the program points:
-    # > l_before
-    # whl.tasm
-    # > l_middle
-    # while (whl.test) {...}
-    # > l_after
-
-    # l_middle is the last liveness of while_live_helper(whl, l_after)
-
-    # print("::::::::::::::::::")
-    for stmt, l_after in while_live_helper(whl, l_after):
-        # if isinstance(stmt, x86.While):
-        #     print("{:.40}".format(str(stmt)), l_after)
-        yield stmt, l_after
-    for stmt, l_after in iter_livenesses(whl.tasm, l_after):
-        # print("{:.40}".format(str(stmt)), l_after)
-        yield stmt, l_after
-    # print("::::::::::::::::::")
-
-
-def while_live_helper(whl, l_after):
-
-    # Consider the program points
-    # > L0
-    # while (whl.test) {
-    # > L1
-    #   whl.body
-    # > L2
-    #   whl.tasm
-    # > L3
-    # }
-    # > l_after
-
-    # Note that:
-    # L0 = liveness_before(whl.test, L1 | l_after)
-    # L1 = liveness_before(whl.body, L2)
-    # L2 = liveness_before(whl.tasm, L3)
-    # L3 = L0
-
-    l0 = set(l_after) | set(
-        [whl.test] if isinstance(whl.test, ext.Name) else []
-    )
-    l3 = l0
-
-    l_test = [(s, set(li)) for s, li in iter_livenesses(whl.tasm, l3)]
-    l2 = set(l_test[-1][1])
-    liveness_step_before(l2, l_test[-1][0])
-
-    l_body = [(s, set(li)) for s, li in iter_livenesses(whl.body, l2)]
-    l1 = set(l_body[-1][1])
-    liveness_step_before(l1, l_body[-1][0])
-
-    l_after_new = l_after | l1
-    diff = l_after_new - l_after
-
-    return (while_live_helper(whl, l_after_new) if diff else (l_test + l_body))
+def linear_scan(cfg, graph, func_args=None):
+    # Allocates in one pass over the live intervals of the names, in the order
+    # of the instructions. An interval spans from the first to the last
+    # position its name occurs or is live at, the blocks being laid out as
+    # remove_ctrl_flow will. Intervals across a call get no caller save
+    # register, nor those across names coalesced into a register that
+    # register. When no register is left, the interval ending last that could
+    # give one is spilled (names limited to registers excepted), to a stack
+    # slot given at the end. LINEAR_SCAN_SCRATCH is not allocated: it loads
+    # the spilled operands of instructions with several ones. Returns the
+    # colors (by id) of the names of graph.
+    starts, ends, calls = {}, {}, []
+
+    def occur(ids, position):
+        for i in ids:
+            starts.setdefault(i, position)
+            ends[i] = position
+
+    bounds, position = [], 0  # the first and last positions of the blocks
+    for block in cfg.blocks:
+        start = position
+        for s in block.stmts:
+            # updated, as names may have been merged since they were cached
+            read, written = graph.operands(s, update=True)
+            occur(read + written, position)
+            if isinstance(s, x86.Call):
+                calls.append(position)
+            position += 1
+        if isinstance(block.test, ext.Name):
+            occur([graph.id(block.test)], position)
+        bounds.append((start, position))
+        position += 1
+
+    solve_liveness(cfg.blocks, graph.operands, lambda t: graph.bits([t]))
+    for block, (start, end) in zip(cfg.blocks, bounds):
+        for i in iter_bits(block.live_in):
+            starts[i] = min(starts.get(i, start), start)
+            ends[i] = max(ends.get(i, start), start)
+        for i in iter_bits(block.live_out):
+            starts[i] = min(starts.get(i, end), end)
+            ends[i] = max(ends.get(i, end), end)
+
+    colors = [NOT_MEM] * len(graph.nodes)
+    colors[:C.N_REGS] = range(C.N_REGS)
+    for i, name in enumerate(func_args or []):
+        arg = graph.ids.get(ext.Name(name))
+        if arg is not None:
+            colors[arg] = - i - 2
+
+    csave_regs = set(graph.ids[r] for r in C.CSAVE_REGS)
+    merged_regs = [r for r in range(C.N_REGS) if r in starts]
+    free_regs = set(range(LINEAR_SCAN_SCRATCH))
+    active = []  # (end, id) of the intervals in registers
+    spilled = []
+
+    for i in sorted(starts, key=lambda i: (starts[i], i)):
+        if colors[i] != NOT_MEM:
+            continue  # registers and stack parameters
+        start, end = starts[i], ends[i]
+        for interval in list(active):
+            if interval[0] <= start:
+                active.remove(interval)
+                free_regs.add(colors[interval[1]])
+
+        max_color = getattr(graph.nodes[i], 'max_color', ext.Name.ANY_COLOR)
+        allowed = set(range(min(max_color, LINEAR_SCAN_SCRATCH)))
+        call = bisect.bisect_right(calls, start)
+        if call < len(calls) and calls[call] < end:
+            allowed -= csave_regs
+        allowed -= set(  # taken by the names coalesced into them
+            r for r in merged_regs if starts[r] < end and start < ends[r]
+        )
+
+        if allowed & free_regs:
+            colors[i] = min(allowed & free_regs)
+            free_regs.remove(colors[i])
+            active.append((end, i))
+            continue
+
+        victims = [
+            (e, n) for e, n in active if colors[n] in allowed
+            and graph.nodes[n].max_color != C.N_REGS
+        ]
+        if max_color != C.N_REGS:
+            victims.append((end, i))
+        if not victims:
+            raise ValueError("no register left for {}".format(graph.nodes[i]))
+        victim = max(victims)
+        if victim[1] != i:
+            active.remove(victim)
+            colors[i] = colors[victim[1]]
+            active.append((end, i))
+        spilled.append(victim[1])
+
+    # slots, given once all the spilled intervals are known, are shared by
+    # as many as their overlaps allow (the fewest, for intervals)
+    free_slots, taken = [], []  # heaps of slots, and of (end, slot)
+    for i in sorted(spilled, key=lambda i: (starts[i], i)):
+        while taken and taken[0][0] <= starts[i]:
+            heapq.heappush(free_slots, heapq.heappop(taken)[1])
+        colors[i] = (
+            heapq.heappop(free_slots) if free_slots else C.N_REGS + len(taken)
+        )
+        heapq.heappush(taken, (ends[i], colors[i]))
+
+    load_spilled_operands(cfg, colors, graph)
+    return colors
 
 
-def liveness_step_before(l_after, inst):
-    l_after -= inst.written_args()
-    l_after |= inst.read_args()
+def load_spilled_operands(cfg, colors, graph):
+    # x86 only allows 1 mem-access / instr.: the first spilled operand of an
+    # instruction with two is moved to LINEAR_SCAN_SCRATCH first (in place)
+    scratch = C.REGS[LINEAR_SCAN_SCRATCH]
+    for block in cfg.blocks:
+        statements = block.stmts
+        i = 0
+        while i < len(statements):
+            s = statements[i]
+            spilled = [
+                j for j, a in enumerate(s.args)
+                if in_memory(graph.color(colors, a))
+            ]
+            if len(spilled) > 1:
+                statements.insert(i, x86.Mov(s.args[spilled[0]], scratch))
+                s.args[spilled[0]] = scratch
+                i += 1
+            i += 1
 
 
-def add_interferences(graph, wargs, interfering):
-    for node in wargs:
-        graph[node] |= interfering
-        for n in interfering:
-            graph[n].add(node)
+def n_variables(stmt):
+    return sum(isinstance(a, ext.Name) for a in stmt.args)
 
 
 def _new_unspillable():
@@ -271,3 +701,12 @@ def _new_unspillable():
 
 
 _new_unspillable.ctr = 0
+
+
+def _new_split():
+    _new_split.ctr += 1
+    # alcs - alloc split
+    return ext.Name('#alcs{}'.format(_new_split.ctr))
+
+
+_new_split.ctr = 0
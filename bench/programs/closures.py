@@ -0,0 +1,16 @@
+def make_adder(k):
+    return lambda x: x + k
+
+
+def compose(f, g):
+    return lambda x: g(f(x))
+
+
+n = input()
+total = 0
+i = 0
+while i < n:
+    add = compose(make_adder(i), make_adder(1))
+    total = add(total)
+    i = i + 1
+print(total)
@@ -0,0 +1,11 @@
+n = input()
+d = {}
+i = 0
+while i < n:
+    d[i] = i + 1
+    i = i + 1
+i = 1
+while i < n:
+    d[i] = d[i] + d[i + -1]
+    i = i + 1
+print(d[n + -1])
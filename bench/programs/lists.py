@@ -0,0 +1,16 @@
+n = input()
+l = []
+i = 0
+while i < n:
+    l = l + [i]
+    i = i + 1
+i = 0
+while i < n:
+    l[i] = l[i] + l[n + -1 + -i]
+    i = i + 1
+total = 0
+i = 0
+while i < len(l):
+    total = total + l[i]
+    i = i + 1
+print(total)
@@ -0,0 +1,10 @@
+n = input()
+total = 0
+i = 0
+while i < n:
+    j = 0
+    while j < n:
+        total = total + (i if j < i else -j)
+        j = j + 1
+    i = i + 1
+print(total)
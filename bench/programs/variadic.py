@@ -0,0 +1,12 @@
+def total(n, *rest):
+    return n + (total(*rest) if len(rest) > 0 else 0)
+
+
+n = input()
+l = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+acc = 0
+i = 0
+while i < n:
+    acc = acc + total(i, *l)
+    i = i + 1
+print(acc)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+# Execution benchmarks: compiles the programs in bench/programs, links them
+# against the runtime and times them over their fixed inputs (NAME.in),
+# alongside CPython running the same script. Cycles and instructions come from
+# perf stat when it is available, the peak RSS from wait4.
+
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPILER_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, COMPILER_DIR)
+
+from pipeline import pycompile  # noqa: E402
+
+PROGRAMS_DIR = os.path.join(BENCH_DIR, 'programs')
+RUNTIME = os.path.join(COMPILER_DIR, 'runtime', 'libpyyruntime.a')
+
+PERF_EVENTS = ('cycles', 'instructions')
+
+
+def find_programs(names=None):
+    found = sorted(
+        os.path.splitext(f)[0] for f in os.listdir(PROGRAMS_DIR)
+        if f.endswith('.py')
+    )
+    for name in names or []:
+        if name not in found:
+            raise ValueError("unknown program '{}'".format(name))
+    return [n for n in found if not names or n in names]
+
+
+def build(name, work_dir, cc, runtime=RUNTIME):
+    with open(os.path.join(PROGRAMS_DIR, name + '.py')) as src:
+        start = time.perf_counter()
+        assembly = str(pycompile(src.read()))
+        compile_seconds = time.perf_counter() - start
+
+    asm = os.path.join(work_dir, name + '.s')
+    exe = os.path.join(work_dir, name)
+    with open(asm, 'w') as out:
+        out.write(assembly)
+    subprocess.check_call(
+        shlex.split(cc) + [asm, runtime, '-lm', '-o', exe]
+    )
+    return exe, compile_seconds
+
+
+def cpython_script(name, work_dir):
+    # our input() reads an int, as in test/generate_expected_outputs.sh
+    with open(os.path.join(PROGRAMS_DIR, name + '.py')) as src:
+        source = re.sub(
+            r'input( *)\(( *)\)', r'int(input\1(\2))', src.read()
+        )
+    script = os.path.join(work_dir, name + '.cpython.py')
+    with open(script, 'w') as out:
+        out.write(source)
+    return script
+
+
+def run(argv, input_path):
+    # returns (stdout, seconds, peak RSS in KiB)
+    with open(input_path) as stdin, tempfile.TemporaryFile() as stdout:
+        start = time.perf_counter()
+        proc = subprocess.Popen(argv, stdin=stdin, stdout=stdout)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - start
+        proc.returncode = status  # reaped, keeps Popen from waiting again
+        if os.WIFSIGNALED(status):
+            raise subprocess.CalledProcessError(-os.WTERMSIG(status), argv)
+        elif os.WEXITSTATUS(status):
+            raise subprocess.CalledProcessError(os.WEXITSTATUS(status), argv)
+        stdout.seek(0)
+        return stdout.read().decode(), seconds, rusage.ru_maxrss
+
+
+def perf_counters(argv, input_path):
+    if shutil.which('perf') is None:
+        return dict.fromkeys(PERF_EVENTS)
+
+    with tempfile.NamedTemporaryFile('r') as report:
+        with open(input_path) as stdin:
+            subprocess.check_call(
+                ['perf', 'stat', '-x', ',', '-o', report.name,
+                 '-e', ','.join(PERF_EVENTS), '--'] + argv,
+                stdin=stdin, stdout=subprocess.DEVNULL
+            )
+        counters = dict.fromkeys(PERF_EVENTS)
+        for line in report:
+            fields = line.strip().split(',')
+            if len(fields) < 3:
+                continue
+            event = fields[2].split(':')[0]
+            if event in counters and fields[0].isdigit():
+                counters[event] = int(fields[0])
+        return counters
+
+
+def measure(argv, input_path, repeat):
+    # best of repeat runs for the time, max for the RSS
+    runs = [run(argv, input_path) for _ in range(repeat)]
+    result = OrderedDict([
+        ('seconds', min(s for _, s, _ in runs)),
+        ('max_rss_kib', max(r for _, _, r in runs)),
+    ])
+    result.update(perf_counters(argv, input_path))
+    return runs[0][0], result
+
+
+def benchmark(name, work_dir, cc, python, repeat, runtime=RUNTIME):
+    input_path = os.path.join(PROGRAMS_DIR, name + '.in')
+    exe, compile_seconds = build(name, work_dir, cc, runtime)
+    output, pyyc = measure([exe], input_path, repeat)
+    expected, cpython = measure(
+        [python, cpython_script(name, work_dir)], input_path, repeat
+    )
+    pyyc['compile_seconds'] = compile_seconds
+    return OrderedDict([
+        ('correct', output == expected),
+        ('pyyc', pyyc),
+        ('cpython', cpython),
+        ('speedup', cpython['seconds'] / pyyc['seconds']),
+    ])
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=COMPILER_DIR,
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results, baseline=None, out=sys.stdout):
+    def count(value):
+        return '{:,}'.format(value) if value is not None else '-'
+
+    print("{:<10} {:>10} {:>10} {:>8} {:>16} {:>16} {:>10}{}".format(
+        'program', 'pyyc (ms)', 'cpython', 'speedup', 'cycles',
+        'instructions', 'RSS (KiB)', '  vs baseline' if baseline else ''
+    ), file=out)
+    for name, res in results.items():
+        pyyc = res['pyyc']
+        change = ''
+        if baseline and name in baseline:
+            change = '  {:+.1%}'.format(
+                pyyc['seconds'] / baseline[name]['pyyc']['seconds'] - 1
+            )
+        print("{:<10} {:>10.2f} {:>10.2f} {:>7.2f}x {:>16} {:>16} {:>10}{}{}"
+              .format(
+                  name, 1e3 * pyyc['seconds'], 1e3 * res['cpython']['seconds'],
+                  res['speedup'], count(pyyc['cycles']),
+                  count(pyyc['instructions']), pyyc['max_rss_kib'], change,
+                  '' if res['correct'] else '  WRONG OUTPUT'
+              ), file=out)
+
+
+if __name__ == "__main__":
+
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description="Time the compiled benchmark programs against CPython"
+    )
+    parser.add_argument('programs', nargs='*',
+                        help="The programs to run (defaults to all of "
+                             "bench/programs).")
+    parser.add_argument('--cc', default='gcc -m32',
+                        help="The command linking the assembly with the "
+                             "runtime.")
+    parser.add_argument('--runtime', default=RUNTIME,
+                        help="The runtime library to link against.")
+    parser.add_argument('--python', default=sys.executable,
+                        help="The python interpreter to compare against.")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Runs per program (the fastest one is kept).")
+    parser.add_argument('--baseline',
+                        help="JSON results of a previous run to compare "
+                             "against.")
+    parser.add_argument('--work-dir',
+                        help="Where to keep the assembly and executables "
+                             "(defaults to a temporary directory).")
+    parser.add_argument('-o', '--output', help="Write the results as JSON.")
+
+    args = parser.parse_args()
+    try:
+        programs = find_programs(args.programs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='pyyc-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = OrderedDict()
+    try:
+        for name in programs:
+            results[name] = benchmark(
+                name, work_dir, args.cc, args.python, args.repeat, args.runtime
+            )
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['programs']
+
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'cc': args.cc,
+                'python': args.python,
+                'programs': results
+            }, f, indent=2)
+
+    sys.exit(0 if all(r['correct'] for r in results.values()) else 1)
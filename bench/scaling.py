@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+# Compile-time scalability benchmarks: generates programs along several size
+# axes, records the time (and peak memory) of every pass with the pipeline's
+# PassRecorder and fits t = c * n^k per pass. A pass whose exponent k exceeds
+# its limit is reported as a regression.
+
+import json
+import math
+import os
+import sys
+import textwrap
+from collections import OrderedDict
+
+COMPILER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, COMPILER_DIR)
+
+from instrument import PassRecorder  # noqa: E402
+from pipeline import pycompile  # noqa: E402
+
+
+def gen_statements(n):
+    return "x0 = input()\n" + ''.join(
+        "x{} = x{} + {}\n".format(i, i - 1, i) for i in range(1, n)
+    ) + "print(x{})\n".format(n - 1)
+
+
+def gen_live_vars(n):
+    return textwrap.dedent("""
+        def f(a):
+        {}
+            return {}
+        print(f(input()))
+    """).format(
+        ''.join("    v{} = a + {}\n".format(i, i) for i in range(n)),
+        ' + '.join('v{}'.format(i) for i in range(n))
+    )
+
+
+def gen_nesting(n):
+    # nested whiles, and as deeply nested if expressions (the subset has no
+    # if statements) in the innermost body
+    lines = ["i = input()"]
+    for d in range(n):
+        indent = '    ' * d
+        lines += [
+            indent + "j{} = 0".format(d),
+            indent + "while j{} < 2:".format(d),
+            indent + "    j{} = j{} + 1".format(d, d),
+        ]
+    lines.append('    ' * n + "print({}i{})".format(
+        ''.join('{} if i < j{} else ('.format(d, d) for d in range(n)),
+        ')' * n
+    ))
+    return '\n'.join(lines) + '\n'
+
+
+def gen_lambdas(n):
+    return "a = input()\n" + ''.join(
+        "f{} = lambda x: x + a + {}\nprint(f{}({}))\n".format(i, i, i, i)
+        for i in range(n)
+    )
+
+
+def gen_variadic(n):
+    return textwrap.dedent("""
+        def g(x, *rest):
+            return x + len(rest)
+        l = [1, 2, 3]
+    """) + ''.join(
+        "print(g({}, *l))\n".format(i) for i in range(n)
+    )
+
+
+def gen_literals(n):
+    return "l = [{}]\nd = {{{}}}\nprint(l[{}])\nprint(d[{}])\n".format(
+        ', '.join(str(i) for i in range(n)),
+        ', '.join('{}: {}'.format(i, i) for i in range(n)),
+        n - 1, n - 1
+    )
+
+
+AXES = OrderedDict([
+    ('statements', gen_statements),
+    ('live_vars', gen_live_vars),
+    ('nesting', gen_nesting),
+    ('lambdas', gen_lambdas),
+    ('variadic', gen_variadic),
+    ('literals', gen_literals),
+])
+
+DEFAULT_SIZES = {
+    'statements': [25, 50, 100, 200],
+    'live_vars': [4, 8, 16, 32],
+    'nesting': [1, 2, 3, 4],
+    'lambdas': [2, 4, 8, 16],
+    'variadic': [2, 4, 8, 16],
+    'literals': [25, 50, 100, 200],
+}
+
+DEFAULT_LIMIT = 1.5
+
+
+def measure(source, repeat=1, memory=False, regalloc='graph'):
+    # per pass totals (summed over functions), best of repeat runs
+    best = {}
+    for _ in range(repeat):
+        recorder = PassRecorder(memory=memory)
+        pycompile(source, recorder, regalloc=regalloc)
+        for r in recorder.summary():
+            if r.name not in best or r.seconds < best[r.name]['seconds']:
+                best[r.name] = {
+                    'seconds': r.seconds,
+                    'peak_memory': r.peak_memory,
+                    'ir_size': r.ir_size
+                }
+    best['total'] = {
+        'seconds': sum(p['seconds'] for p in best.values()),
+        'peak_memory': max(p['peak_memory'] or 0 for p in best.values()),
+        'ir_size': None
+    }
+    return best
+
+
+def fit_exponent(sizes, values):
+    # least squares fit of log(value) = log(c) + k * log(size)
+    points = [
+        (math.log(s), math.log(v)) for s, v in zip(sizes, values) if v > 0
+    ]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mx) ** 2 for x, _ in points)
+    sxy = sum((x - mx) * (y - my) for x, y in points)
+    return sxy / sxx if sxx else None
+
+
+def run_axis(axis, sizes, repeat, memory, regalloc='graph'):
+    measurements = OrderedDict(
+        (size, measure(AXES[axis](size), repeat, regalloc=regalloc))
+        for size in sizes
+    )
+    if memory:
+        for size in sizes:
+            mem = measure(AXES[axis](size), memory=True, regalloc=regalloc)
+            for name, m in measurements[size].items():
+                m['peak_memory'] = mem[name]['peak_memory']
+
+    passes = next(iter(measurements.values())).keys()
+    fits = OrderedDict()
+    for name in passes:
+        fits[name] = {
+            'time_exponent': fit_exponent(
+                sizes, [measurements[s][name]['seconds'] for s in sizes]
+            ),
+            'memory_exponent': fit_exponent(
+                sizes, [measurements[s][name]['peak_memory'] or 0
+                        for s in sizes]
+            ) if memory else None
+        }
+    return {'sizes': sizes, 'measurements': measurements, 'fits': fits}
+
+
+def regressions(results, limits, baseline=None, tolerance=0.25):
+    found = []
+    for axis, res in results.items():
+        for name, fit in res['fits'].items():
+            k = fit['time_exponent']
+            if k is None:
+                continue
+            limit = limits.get(name, limits.get('*', DEFAULT_LIMIT))
+            if k > limit:
+                found.append((axis, name, k, "limit {}".format(limit)))
+            if baseline and axis in baseline:
+                old = baseline[axis]['fits'].get(name, {})
+                old = old.get('time_exponent')
+                if old is not None and k > old + tolerance:
+                    found.append((axis, name, k, "was {:.2f}".format(old)))
+    return found
+
+
+def print_report(results, found, out=sys.stdout):
+    flagged = set((axis, name) for axis, name, _, _ in found)
+    for axis, res in results.items():
+        print("== {} (n = {})".format(
+            axis, ', '.join(map(str, res['sizes']))
+        ), file=out)
+        for name, fit in res['fits'].items():
+            times = ' '.join(
+                '{:9.2f}'.format(1e3 * m[name]['seconds'])
+                for m in res['measurements'].values()
+            )
+            k = fit['time_exponent']
+            print("  {:<22} {} ms  k={}{}{}".format(
+                name, times, '{:.2f}'.format(k) if k is not None else '-',
+                '  mem k={:.2f}'.format(fit['memory_exponent'])
+                if fit['memory_exponent'] is not None else '',
+                '  <-- REGRESSION' if (axis, name) in flagged else ''
+            ), file=out)
+    for axis, name, k, why in found:
+        print("regression: {} scales as n^{:.2f} along {} ({})".format(
+            name, k, axis, why
+        ), file=out)
+
+
+def parse_limits(specs):
+    limits = {}
+    for spec in specs:
+        name, _, value = spec.rpartition('=')
+        limits[name or '*'] = float(value)
+    return limits
+
+
+if __name__ == "__main__":
+
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description="Measure how each compiler pass scales with program size"
+    )
+    parser.add_argument('axes', nargs='*',
+                        help="The axes to benchmark: {} (defaults to "
+                             "all).".format(', '.join(AXES)))
+    parser.add_argument('--sizes',
+                        type=lambda s: [int(n) for n in s.split(',')],
+                        help="Comma separated program sizes (overrides the "
+                             "per axis defaults).")
+    parser.add_argument('--scale', type=float, default=1,
+                        help="Multiplies the default sizes.")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per size (the fastest one is kept).")
+    parser.add_argument('--memory', action='store_true',
+                        help="Also measure the peak memory of each pass.")
+    parser.add_argument('--regalloc', choices=['graph', 'linear'],
+                        default='graph', help="The register allocator.")
+    parser.add_argument('--limit', action='append', default=[],
+                        metavar='[PASS=]K',
+                        help="Maximum exponent of a pass, or of all passes "
+                             "(default {}).".format(DEFAULT_LIMIT))
+    parser.add_argument('--baseline',
+                        help="JSON results of a previous run: passes whose "
+                             "exponent grew by more than --tolerance are "
+                             "regressions.")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('-o', '--output', help="Write the results as JSON.")
+
+    args = parser.parse_args()
+    for axis in args.axes:
+        if axis not in AXES:
+            parser.error("unknown axis '{}'".format(axis))
+
+    results = OrderedDict()
+    for axis in args.axes or AXES:
+        sizes = args.sizes or [
+            max(1, int(round(n * args.scale))) for n in DEFAULT_SIZES[axis]
+        ]
+        results[axis] = run_axis(
+            axis, sizes, args.repeat, args.memory, args.regalloc
+        )
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['axes']
+
+    found = regressions(results, parse_limits(args.limit), baseline,
+                        args.tolerance)
+    print_report(results, found)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'axes': results,
+                'regressions': [
+                    {'axis': a, 'pass': p, 'exponent': k, 'reason': why}
+                    for a, p, k, why in found
+                ]
+            }, f, indent=2)
+
+    sys.exit(1 if found else 0)
@@ -0,0 +1,186 @@
+import fcntl
+import glob
+import hashlib
+import json
+import os
+from collections import Counter
+from contextlib import contextmanager
+
+
+COMPILER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024  # bytes
+
+
+def default_cache_dir():
+    return os.environ.get('PYYC_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'pyyc'
+    )
+
+
+def compiler_fingerprint():
+    # the passes, constants.py and the driver all live next to this file
+    if compiler_fingerprint.value is None:
+        sha = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(COMPILER_DIR, '*.py'))):
+            sha.update(os.path.basename(path).encode())
+            with open(path, 'rb') as src:
+                sha.update(hashlib.sha256(src.read()).digest())
+        compiler_fingerprint.value = sha.hexdigest()
+    return compiler_fingerprint.value
+
+
+compiler_fingerprint.value = None
+
+
+class CompileCache:
+
+    SUFFIX = '.json'
+    SHARD = '[0-9a-f]' * 2  # the directory of an entry (not stats.json's)
+
+    def __init__(self, path=None, max_size=DEFAULT_MAX_SIZE, root=None):
+        # the entries under root (by default path), subcaches included,
+        # share max_size
+        self.path = path or default_cache_dir()
+        self.max_size = max_size
+        self.root = root or self.path
+        # the hits, misses and bytes written since the last flush
+        self.pending = Counter()
+
+    def key(self, source, options=''):
+        sha = hashlib.sha256()
+        for part in (compiler_fingerprint(), options, source):
+            sha.update(part.encode())
+            sha.update(b'\0')
+        return sha.hexdigest()
+
+    def get(self, key):
+        entry = self._entry(key)
+        try:
+            with open(entry) as cached:
+                value = cached.read()
+        except FileNotFoundError:
+            self.pending['misses'] += 1
+            return None
+        try:
+            os.utime(entry)  # the mtime orders entries for LRU eviction
+        except FileNotFoundError:
+            pass  # evicted concurrently, after it was read
+        self.pending['hits'] += 1
+        return value
+
+    def put(self, key, value, flush=True):
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(entry, os.getpid())
+        with open(tmp, 'w') as cached:
+            cached.write(value)
+        self.pending['size'] += os.path.getsize(tmp)
+        try:
+            self.pending['size'] -= os.path.getsize(entry)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, entry)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        # Adds the pending counts to stats.json, and the bytes written to the
+        # size of root recorded in its stats.json, evicting when that goes
+        # over max_size. Callers flush once per compile, rather than lock the
+        # stats files on every lookup.
+        hits, misses, size = (
+            self.pending.pop(k, 0) for k in ('hits', 'misses', 'size')
+        )
+        if hits or misses:
+            with self._stats_file(self.path) as stats:
+                counts = json.load(stats)
+                counts['hits'] += hits
+                counts['misses'] += misses
+                _rewrite(stats, counts)
+        if size:
+            with self._stats_file(self.root) as stats:
+                counts = json.load(stats)
+                if 'size' in counts:
+                    counts['size'] += size
+                else:  # recorded by an older compiler
+                    counts['size'] = self._size()
+                if counts['size'] > self.max_size:
+                    counts['size'] = self.evict()
+                _rewrite(stats, counts)
+
+    def subcache(self, name):
+        return CompileCache(
+            os.path.join(self.path, name), self.max_size, self.root
+        )
+
+    def evict(self):
+        # the least recently used entries under root go first. Returns the
+        # size left.
+        entries = sorted(self._stat_entries(self._budget_entries()))
+        size = sum(s for _, s, _ in entries)
+        for _, entry_size, entry in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.unlink(entry)
+            except FileNotFoundError:
+                continue  # evicted concurrently
+            size -= entry_size
+        return size
+
+    def stats(self):
+        with self._stats_file(self.path) as stats:
+            counts = json.load(stats)
+        entries = list(self._stat_entries(self._entries()))
+        counts.update(
+            entries=len(entries),
+            size=sum(s for _, s, _ in entries)
+        )
+        return counts
+
+    def _entry(self, key):
+        return os.path.join(self.path, key[:2], key + self.SUFFIX)
+
+    def _entries(self):
+        return glob.glob(
+            os.path.join(self.path, self.SHARD, '*' + self.SUFFIX)
+        )
+
+    def _budget_entries(self):
+        return glob.glob(
+            os.path.join(self.root, '**', self.SHARD, '*' + self.SUFFIX),
+            recursive=True
+        )
+
+    def _size(self):
+        return sum(s for _, s, _ in self._stat_entries(self._budget_entries()))
+
+    def _stat_entries(self, entries):
+        # (mtime, size, path) of the entries that other workers don't evict
+        # in the meantime
+        for entry in entries:
+            try:
+                st = os.stat(entry)
+            except FileNotFoundError:
+                continue  # evicted concurrently
+            yield st.st_mtime, st.st_size, entry
+
+    @contextmanager
+    def _stats_file(self, path):
+        # locked, since batch compilation updates the stats from many workers
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'stats.json'), 'a+') as stats:
+            fcntl.flock(stats, fcntl.LOCK_EX)
+            stats.seek(0)
+            if not stats.read(1):
+                json.dump({'hits': 0, 'misses': 0}, stats)
+            stats.seek(0)
+            yield stats
+
+
+def _rewrite(stats, counts):
+    stats.seek(0)
+    stats.truncate()
+    json.dump(counts, stats)
@@ -0,0 +1,235 @@
+import extendedast as ext
+import x86ir as x86
+
+
+class BasicBlock:
+
+    def __init__(self, index):
+        self.index = index
+        self.stmts = []
+        # if set, the block branches to succs[0] if test is not 0 (or, for
+        # x86.Flags, if the flags of its last cmpl meet the condition), else
+        # to succs[1]
+        self.test = None
+        self.succs = []
+        self.preds = []
+        self.idom = None  # immediate dominator
+        self.dominated = []  # the blocks it is the immediate dominator of
+        self.loop_depth = 0
+        self.live_in = self.live_out = 0
+
+    def link(self, succ):
+        self.succs.append(succ)
+        succ.preds.append(self)
+
+    def __repr__(self):
+        return "B{}".format(self.index)
+
+
+class Loop:
+
+    def __init__(self, header, blocks):
+        self.header = header
+        self.blocks = blocks  # the header included
+
+    def preheader(self):
+        # the only block entering the loop, if it jumps to nothing else
+        outside = [p for p in self.header.preds if p not in self.blocks]
+        if len(outside) == 1 and outside[0].succs == [self.header]:
+            return outside[0]
+        return None
+
+    def exits(self):
+        # the blocks the loop exits to, if only reached from it
+        exits = set(
+            s for b in self.blocks for s in b.succs if s not in self.blocks
+        )
+        if all(p in self.blocks for e in exits for p in e.preds):
+            return sorted(exits, key=lambda b: b.index)
+        return None
+
+
+class CFG:
+    # The blocks of a function, in the order they are laid out, the entry
+    # first.
+
+    def __init__(self):
+        self.blocks = []
+
+    @property
+    def entry(self):
+        return self.blocks[0]
+
+    def new_block(self):
+        return self.place(BasicBlock(None))
+
+    def place(self, block):
+        # appends a block created on its own
+        block.index = len(self.blocks)
+        self.blocks.append(block)
+        return block
+
+    def place_before(self, block, blocks):
+        # inserts blocks created on their own, in order, before block
+        i = self.blocks.index(block)
+        self.blocks[i:i] = blocks
+        for i, b in enumerate(self.blocks):
+            b.index = i
+
+    def instructions(self):
+        for block in self.blocks:
+            yield from block.stmts
+
+    def reverse_postorder(self):
+        order, seen = [], set()
+        stack = [(self.entry, iter(self.entry.succs))]
+        seen.add(self.entry)
+        while stack:
+            block, succs = stack[-1]
+            for succ in succs:
+                if succ not in seen:
+                    seen.add(succ)
+                    stack.append((succ, iter(succ.succs)))
+                    break
+            else:
+                order.append(block)
+                stack.pop()
+        return order[::-1]
+
+    def compute_dominators(self):
+        # Cooper, Harvey and Kennedy's iterative algorithm, over the blocks
+        # reachable from the entry
+        order = self.reverse_postorder()
+        rpo = {b: i for i, b in enumerate(order)}
+        for block in self.blocks:
+            block.idom, block.dominated = None, []
+        self.entry.idom = self.entry
+
+        def intersect(a, b):
+            while a is not b:
+                while rpo[a] > rpo[b]:
+                    a = a.idom
+                while rpo[b] > rpo[a]:
+                    b = b.idom
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                preds = [p for p in block.preds if p.idom is not None]
+                idom = preds[0]
+                for p in preds[1:]:
+                    idom = intersect(p, idom)
+                if block.idom is not idom:
+                    block.idom = idom
+                    changed = True
+
+        for block in order[1:]:
+            block.idom.dominated.append(block)
+        self.entry.idom = None
+
+    def natural_loops(self):
+        # Also sets the loop depth of the blocks. The loops sharing a header
+        # are one, inner loops come first.
+        self.compute_dominators()
+        bodies = {}
+        for block in self.blocks:
+            for succ in block.succs:
+                if dominates(succ, block):  # a back edge
+                    body = bodies.setdefault(succ, {succ})
+                    stack = [block]
+                    while stack:
+                        b = stack.pop()
+                        if b not in body:
+                            body.add(b)
+                            stack.extend(b.preds)
+
+        for block in self.blocks:
+            block.loop_depth = 0
+        loops = []
+        for header, body in bodies.items():
+            loops.append(Loop(header, body))
+            for block in body:
+                block.loop_depth += 1
+        loops.sort(key=lambda loop: (len(loop.blocks), loop.header.index))
+        return loops
+
+    def remove_unreachable(self):
+        reachable = set(self.reverse_postorder())
+        for block in self.blocks:
+            if block not in reachable:
+                for succ in block.succs:
+                    succ.preds.remove(block)
+        self.blocks = [b for b in self.blocks if b in reachable]
+        for i, block in enumerate(self.blocks):
+            block.index = i
+
+
+def dominates(a, b):
+    # once compute_dominators ran
+    while b is not None and b is not a:
+        b = b.idom
+    return b is a
+
+
+def build_cfg(statements):
+    # From the structured x86ir of flatten (with If and While), laid out as
+    # remove_ctrl_flow used to: an If's condition, its body, then its orelse,
+    # a While's condition (tasm and test), then its body.
+    cfg = CFG()
+
+    def split(stmts, block):
+        # returns the block where stmts end
+        for s in stmts:
+            if isinstance(s, x86.If):
+                body, orelse = BasicBlock(None), BasicBlock(None)
+                branch(block, s.test, body, orelse)
+                body_end = split(s.body, cfg.place(body))
+                orelse_end = split(s.orelse, cfg.place(orelse))
+                block = cfg.new_block()
+                body_end.link(block)
+                orelse_end.link(block)
+
+            elif isinstance(s, x86.While):
+                cond = cfg.new_block()
+                block.link(cond)
+                body, block = BasicBlock(None), BasicBlock(None)
+                branch(split(s.tasm, cond), s.test, body, block)
+                split(s.body, cfg.place(body)).link(cond)
+                cfg.place(block)
+
+            else:
+                block.stmts.append(s)
+        return block
+
+    def branch(block, cond, true, false):
+        # ends block with a branch to true if cond holds, else to false: the
+        # conditions of a Choice get blocks of their own (unless constant),
+        # so that and, or and not short circuit
+        if isinstance(cond, x86.Choice):
+            targets = [
+                (true if c.value else false)
+                if not stmts and isinstance(c, ext.Const) else BasicBlock(None)
+                for stmts, c in (cond.body, cond.orelse)
+            ]
+            stmts, test = cond.test
+            branch(split(stmts, block), test, *targets)
+            for (stmts, c), target in zip((cond.body, cond.orelse), targets):
+                if target is not true and target is not false:
+                    branch(split(stmts, cfg.place(target)), c, true, false)
+
+        elif isinstance(cond, ext.Const):
+            block.link(true if cond.value else false)
+
+        else:
+            if isinstance(cond, x86.Compare):
+                block.stmts.append(x86.Cmp(cond.right, cond.left))
+                block.test = x86.Flags(cond.cc)
+            else:
+                block.test = cond
+            block.link(true)
+            block.link(false)
+
+    split(statements, cfg.new_block())
+    return cfg
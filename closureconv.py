@@ -56,7 +56,7 @@ def _blockify(node, name):
         [a.arg for a in aargs.args]
         + ([aargs.vararg.arg] if aargs.vararg else [])
     ) if aargs else [])
-    fvs = getattr(node, 'free_vars', set())
+    fvs = getattr(node, 'free_vars', [])
     newBody = [
         ast.Assign(
             [ast.Name(fv, ast.Store())],
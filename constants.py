@@ -56,13 +56,14 @@ def ConstBool(n):
 
 CSAVE_REGS = set(ext.Reg(r) for r in ("eax", "ecx", "edx"))  # caller save
 REGS = [ext.Reg(r) for r in ("eax", "ebx", "ecx", "edx", "esi", "edi")]
-CALLEE_SAVE_REGS = list(set(REGS) - CSAVE_REGS)
+CALLEE_SAVE_REGS = [r for r in REGS if r not in CSAVE_REGS]  # in order
 
 N_REGS = N_REGS_32 = len(REGS)
 N_REGS_8 = 4
 
 INSTANTIATING_INSTRUCTIONS = (
     x86.Mov,
+    x86.Load,
     *x86.CmpResult.comparators,
     x86.Pop
 )
@@ -0,0 +1,296 @@
+from collections import defaultdict, deque
+
+import extendedast as ext
+import x86ir as x86
+from dataflow import solve_liveness
+
+
+# Sparse conditional constant propagation over the CFG of a function. A name
+# is None (unknown) until some definition reaches it, a constant (an
+# ext.Const) if every one gives that constant, else VARYING, and only the
+# edges found executable are followed: a branch whose test is a constant only
+# follows one of them. The names defined once have one value, and a change
+# revisits the blocks using them. The others are not in SSA form (ifs assign
+# their result in both branches, loops reassign their variables): their
+# values are propagated from block to block, for those live there. The flags
+# set by a cmpl are tracked in its block, as the pair of its operands.
+
+VARYING = 'varying'
+FLAGS = 'flags'
+
+FOLDS = {
+    x86.Add: lambda src, dst: dst + src,
+    x86.Sub: lambda src, dst: dst - src,
+    x86.And: lambda src, dst: dst & src,
+    x86.Or: lambda src, dst: dst | src,
+    x86.Xor: lambda src, dst: dst ^ src,
+    x86.Sal: lambda src, dst: dst << (src & 31),
+    x86.Sar: lambda src, dst: dst >> (src & 31),
+}
+
+# cmpl a, b then setX compares b to a
+COMPARISONS = {
+    x86.Sete: x86.CONDITIONS['e'],
+    x86.Setne: x86.CONDITIONS['ne'],
+    x86.Setl: x86.CONDITIONS['l'],
+    x86.Setnl: x86.CONDITIONS['nl'],
+    x86.Setg: x86.CONDITIONS['g'],
+    x86.Setng: x86.CONDITIONS['ng'],
+}
+
+# the arguments that can be immediates
+IMMEDIATE_ARGS = {
+    x86.Mov: 0, x86.Push: 0, x86.Cmp: 0, x86.Add: 0, x86.Sub: 0, x86.And: 0,
+    x86.Or: 0, x86.Xor: 0, x86.Sal: 0, x86.Sar: 0
+}
+
+
+def propagate_constants(cfg, func_args=None):
+    # In place: the names read where they are constants become immediates,
+    # the instructions computing a constant become a move of it, the cmpl
+    # of constants go (their setX being such moves), and so do the branches
+    # never taken and the blocks only they reached.
+    propagation = ConstantPropagation(cfg, func_args)
+    propagation.solve()
+
+    for block in cfg.blocks:
+        if block not in propagation.states:
+            continue
+        state = dict(propagation.states[block])
+        new_statements = []
+        for s in block.stmts:
+            s = propagation.fold_instruction(s, state)
+            if s is not None:
+                new_statements.append(s)
+        block.stmts = new_statements
+
+        test = propagation.test_value(block.test, state)
+        if block.test is not None and is_int(test):
+            taken = block.succs[0] if test.value else block.succs[1]
+            for succ in block.succs:
+                if succ is not taken:
+                    succ.preds.remove(block)
+            block.test, block.succs = None, [taken]
+        elif isinstance(block.test, x86.Flags):
+            swap_constant_comparand(block, propagation.value(
+                block.stmts[-1].args[1], state
+            ))
+
+    cfg.remove_unreachable()
+    return cfg
+
+
+class ConstantPropagation:
+
+    def __init__(self, cfg, func_args=None):
+        self.cfg = cfg
+        self.states = {}  # of the blocks reached, at their start
+        self.values = {}  # of the names defined once
+        self.worklist, self.queued = deque(), set()
+
+        n_defs, self.uses = defaultdict(int), defaultdict(set)
+        for name in func_args or []:
+            n_defs[ext.Name(name)] += 1
+        for block in cfg.blocks:
+            for s in block.stmts:
+                for name in s.written_args():
+                    n_defs[name] += 1
+                for name in s.read_args():
+                    self.uses[name].add(block)
+            if isinstance(block.test, ext.Name):
+                self.uses[block.test].add(block)
+        self.defined_once = set(
+            name for name, n in n_defs.items() if n == 1
+        )
+
+        # the others, only where live
+        self.ids = {
+            name: i for i, name in enumerate(
+                name for name in n_defs if name not in self.defined_once
+            )
+        }
+
+        def operands(inst):
+            return (
+                [self.ids[a] for a in inst.read_args() if a in self.ids],
+                [self.ids[a] for a in inst.written_args() if a in self.ids]
+            )
+
+        def test_bits(test):
+            return 1 << self.ids[test] if test in self.ids else 0
+
+        solve_liveness(cfg.blocks, operands, test_bits)
+
+        for name in func_args or []:
+            self.set_value({}, ext.Name(name), VARYING)
+        self.states[cfg.entry] = self.live_at(cfg.entry, {
+            ext.Name(name): VARYING for name in func_args or []
+        })
+
+    def solve(self):
+        self.enqueue(self.cfg.entry)
+        while self.worklist:
+            block = self.worklist.popleft()
+            self.queued.remove(block)
+
+            state = dict(self.states[block])
+            for s in block.stmts:
+                self.transfer(s, state)
+
+            for succ in self.executable_succs(block, state):
+                old = self.states.get(succ)
+                new = meet(old, self.live_at(succ, state))
+                if new != old:
+                    self.states[succ] = new
+                    self.enqueue(succ)
+
+    def live_at(self, block, state):
+        # the part of state live at the start of block (without the flags)
+        return {
+            name: v for name, v in state.items()
+            if name in self.ids and block.live_in >> self.ids[name] & 1
+        }
+
+    def enqueue(self, block):
+        if block not in self.queued:
+            self.queued.add(block)
+            self.worklist.append(block)
+
+    def executable_succs(self, block, state):
+        test = self.test_value(block.test, state)
+        if block.test is None or not is_int(test):
+            return block.succs
+        return [block.succs[0] if test.value else block.succs[1]]
+
+    def value(self, arg, state):
+        # None if no definition reached yet
+        if isinstance(arg, ext.Name):
+            values = self.values if arg in self.defined_once else state
+            return values.get(arg)
+        elif isinstance(arg, ext.Const):
+            return arg
+        return VARYING  # registers
+
+    def test_value(self, test, state):
+        # of the test of a block, with the state at its end
+        if isinstance(test, x86.Flags):
+            flags = state.get(FLAGS, VARYING)
+            return flags if flags in (None, VARYING) else ext.Const(int(
+                x86.CONDITIONS[test.cc](flags[1].value, flags[0].value)
+            ))
+        return self.value(test, state)
+
+    def set_value(self, state, name, v):
+        if name not in self.defined_once:
+            values = state
+        elif self.values.get(name) != v:
+            values = self.values
+            for block in self.uses[name]:
+                if block in self.states:
+                    self.enqueue(block)
+        else:
+            return
+        if v is None:
+            values.pop(name, None)
+        else:
+            values[name] = v
+
+    def transfer(self, s, state):
+        # the effect of s on state (and values), in place
+        if isinstance(s, x86.Cmp):
+            a, b = (self.value(arg, state) for arg in s.args)
+            state[FLAGS] = combine((a, b), lambda: (a, b))
+            return
+
+        if isinstance(s, x86.Mov):
+            result = self.value(s.args[0], state)
+        elif type(s) in FOLDS:
+            src, dst = (self.value(arg, state) for arg in s.args)
+            result = combine((src, dst), lambda: ext.Const(wrap(
+                FOLDS[type(s)](src.value, dst.value)
+            )))
+        elif isinstance(s, x86.Neg):
+            dst = self.value(s.args[0], state)
+            result = combine((dst,), lambda: ext.Const(wrap(-dst.value)))
+        elif type(s) in COMPARISONS:
+            # setX only writes the low byte, but flatten masks it with andl $1
+            # right after, so a constant result can be moved in whole
+            flags = state.get(FLAGS, VARYING)
+            result = flags if flags in (None, VARYING) else ext.Const(int(
+                COMPARISONS[type(s)](flags[1].value, flags[0].value)
+            ))
+        else:
+            result = VARYING
+
+        for arg in s.written_args():
+            self.set_value(state, arg, result)
+        if not isinstance(
+            s, (x86.Mov, x86.Push, x86.Pop) + tuple(COMPARISONS)
+        ):
+            state[FLAGS] = VARYING
+
+    def fold_instruction(self, s, state):
+        # returns what replaces s (None to remove it), and applies it to
+        # state
+        if isinstance(s, x86.Cmp) and all(
+            is_int(self.value(arg, state)) for arg in s.args
+        ):
+            self.transfer(s, state)
+            return None
+
+        i = IMMEDIATE_ARGS.get(type(s))
+        if i is not None and isinstance(s.args[i], ext.Name):
+            v = self.value(s.args[i], state)
+            if isinstance(v, ext.Const):
+                s.args[i] = v
+
+        self.transfer(s, state)
+        written = s.written_args()
+        if len(written) == 1 and not isinstance(s, x86.Mov):
+            dst = written.pop()
+            v = self.value(dst, state)
+            if isinstance(v, ext.Const):
+                return x86.Mov(v, dst)
+        return s
+
+
+def swap_constant_comparand(block, v):
+    # The cmpl ending block can't compare to an immediate, e.g. the 3 of
+    # 3 < x (explicate binds it to a name): when v, the value compared, is a
+    # constant, compare the other operand to it instead, and swap the
+    # condition.
+    cmp = block.stmts[-1]
+    if is_int(v) and not isinstance(cmp.args[0], ext.Const):
+        block.stmts[-1] = x86.Cmp(v, cmp.args[0])
+        block.test = x86.Flags(x86.SWAPPED_CC[block.test.cc])
+
+
+def meet(state, other):
+    if state is None:
+        return dict(other)
+    met = dict(state)
+    for name, v in other.items():
+        if met.setdefault(name, v) != v:
+            met[name] = VARYING
+    return met
+
+
+def is_int(v):
+    return isinstance(v, ext.Const) and isinstance(v.value, int)
+
+
+def combine(operands, fold):
+    # the folded value if the operands are all int constants
+    if any(v is VARYING for v in operands):
+        return VARYING
+    elif any(v is None for v in operands):
+        return None
+    elif all(map(is_int, operands)):
+        return fold()
+    return VARYING
+
+
+def wrap(n):
+    # to a signed 32 bits int
+    n &= 0xffffffff
+    return n - (1 << 32) if n & 0x80000000 else n
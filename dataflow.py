@@ -0,0 +1,57 @@
+from collections import deque
+
+
+def solve_liveness(blocks, operands, test_bits):
+    # Live variables as bitsets: operands(inst) gives the (read, written) ids
+    # of an instruction, test_bits(test) the bits a branch reads. Sets the
+    # live_in and live_out of every block.
+    gen, kill = [], []
+    for block in blocks:
+        block.live_in = block.live_out = 0  # of a previous solve, if any
+        live, defs = test_bits(block.test), 0
+        for inst in reversed(block.stmts):
+            live = step_before(live, operands(inst))
+            for node in operands(inst)[1]:
+                defs |= 1 << node
+        gen.append(live)
+        kill.append(defs)
+
+    # backwards, so that most blocks see their successors' final live_in
+    worklist = deque(reversed(blocks))
+    queued = [True] * len(blocks)
+    while worklist:
+        block = worklist.popleft()
+        queued[block.index] = False
+
+        live_out = 0
+        for succ in block.succs:
+            live_out |= succ.live_in
+        block.live_out = live_out
+
+        live_in = gen[block.index] | (live_out & ~kill[block.index])
+        if live_in != block.live_in:
+            block.live_in = live_in
+            for pred in block.preds:
+                if not queued[pred.index]:
+                    queued[pred.index] = True
+                    worklist.append(pred)
+
+
+def iter_livenesses(blocks, operands, test_bits):
+    # Yields every instruction (backwards in each block) with the variables
+    # live after it, once solve_liveness ran.
+    for block in blocks:
+        l_after = block.live_out | test_bits(block.test)
+        for inst in reversed(block.stmts):
+            yield inst, l_after
+            l_after = step_before(l_after, operands(inst))
+
+
+def step_before(l_after, operands):
+    # L_before = (L_after - W) U R
+    read, written = operands
+    for node in written:
+        l_after &= ~(1 << node)
+    for node in read:
+        l_after |= 1 << node
+    return l_after
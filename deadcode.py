@@ -0,0 +1,100 @@
+import extendedast as ext
+import x86ir as x86
+from constants import INSTANTIATING_INSTRUCTIONS, MODIFYING_INSTRUCTIONS
+from dataflow import solve_liveness, step_before
+from defunctioning import return_label
+
+
+def eliminate_dead_code(cfg, func_name, stats=None):
+    # In place: removes the code after returns (and the blocks only it
+    # reached), then, until none is left, the instructions whose only effect
+    # is to write names dead after them, or the flags no setX reads. Calls,
+    # pushes, pops and writes to registers (%esp, %eax) are always kept. The
+    # number of instructions removed goes in stats, for pyyc --debug.
+    n_removed = remove_after_returns(cfg, func_name)
+    while True:
+        n = remove_dead_instructions(cfg)
+        if not n:
+            break
+        n_removed += n
+    if stats is not None:
+        stats['dead_code'] = n_removed
+    return cfg
+
+
+def remove_after_returns(cfg, func_name):
+    # returns how many instructions were removed
+    n_removed = 0
+    for block in cfg.blocks:
+        for i, s in enumerate(block.stmts):
+            if isinstance(s, x86.Jmp) and \
+                    s.args == [return_label(func_name)]:
+                n_removed += len(block.stmts) - i - 1
+                block.stmts = block.stmts[:i + 1]
+                for succ in block.succs:
+                    succ.preds.remove(block)
+                block.test, block.succs = None, []
+                break
+
+    reachable = set(cfg.reverse_postorder())
+    n_removed += sum(len(b.stmts) for b in cfg.blocks if b not in reachable)
+    cfg.remove_unreachable()
+    return n_removed
+
+
+def remove_dead_instructions(cfg):
+    # one sweep backwards over each block (so that the instructions only
+    # feeding dead ones in the block go at once), returns how many were
+    # removed
+    ids = {}
+
+    def operands(inst):
+        return (
+            [ids.setdefault(a, len(ids)) for a in inst.read_args()],
+            [ids.setdefault(a, len(ids)) for a in inst.written_args()]
+        )
+
+    def test_bits(test):
+        if isinstance(test, ext.Name):
+            return 1 << ids.setdefault(test, len(ids))
+        return 0
+
+    solve_liveness(cfg.blocks, operands, test_bits)
+
+    n_removed = 0
+    for block in cfg.blocks:
+        l_after = block.live_out | test_bits(block.test)
+        # by a setX after the instruction, or the branch
+        flags_read = isinstance(block.test, x86.Flags)
+        kept = []
+        for s in reversed(block.stmts):
+            if is_dead(s, l_after, flags_read, ids):
+                n_removed += 1
+                continue
+            kept.append(s)
+            l_after = step_before(l_after, operands(s))
+            if isinstance(s, tuple(x86.CmpResult.comparators)):
+                flags_read = True
+            elif writes_flags(s):
+                flags_read = False
+        block.stmts = kept[::-1]
+    return n_removed
+
+
+def is_dead(s, l_after, flags_read, ids):
+    if writes_flags(s) and flags_read:
+        return False
+    elif isinstance(s, x86.Cmp):
+        return True
+    elif isinstance(s, x86.Mov) and s.args[0] == s.args[1]:
+        return True
+    elif isinstance(s, x86.Pop) or not isinstance(
+        s, INSTANTIATING_INSTRUCTIONS + MODIFYING_INSTRUCTIONS
+    ):
+        return False
+    dst = s.args[-1]
+    return isinstance(dst, ext.Name) and not l_after >> ids[dst] & 1
+
+
+def writes_flags(s):
+    return isinstance(s, (x86.Cmp, x86.Call) + MODIFYING_INSTRUCTIONS)
@@ -1,28 +1,71 @@
 
+import re
+
 import extendedast as ext
 import x86ir as x86
 from constants import CALLEE_SAVE_REGS
 
 
-def wrap_function(scoped_block):
+def wrap_function(scoped_block, stats=None):
+    # Only saves the callee save registers the function uses, and only sets
+    # up %ebp for the spill slots (right below it, above the saved registers)
+    # or for the parameters when %esp moves (around calls): otherwise they
+    # are addressed from %esp. The sizes of the spill slots and of the saved
+    # registers go in stats, for pyyc --debug.
     stmts, stack_size = scoped_block.body
+    name = scoped_block.name
 
-    prologue = [
-        x86.Directive('align', [16]),
-        x86.Label(scoped_block.name),
-        x86.Push(ext.Reg('ebp')),
-        x86.Mov(ext.Reg('esp'), ext.Reg('ebp')),
-    ] + [x86.Push(reg) for reg in CALLEE_SAVE_REGS]
-    if stack_size > 0:
-        prologue.append(x86.Sub(ext.Const(stack_size), ext.Reg('esp')))
-
-    return prologue + stmts + [
-        x86.Mov(ext.Const(0), ext.Reg('eax')),
-        x86.Label(return_label(scoped_block.name))
-    ] + [x86.Pop(reg) for reg in reversed(CALLEE_SAVE_REGS)] + [
-        x86.Leave(),
-        x86.Ret()
+    args = [
+        a for s in stmts if isinstance(s, x86.X86Instruction) for a in s.args
     ]
+    used = set(args)
+    saved = [reg for reg in CALLEE_SAVE_REGS if reg in used]
+    uses_ebp = any(EBP_OFFSET.match(a) for a in args if isinstance(a, str))
+    moves_esp = ext.Reg('esp') in args or any(
+        isinstance(s, (x86.Push, x86.Pop, x86.Call)) for s in stmts
+    )
+    frame = stack_size > 0 or uses_ebp and moves_esp
+    if uses_ebp and not frame:
+        # above the saved registers and the return address
+        for s in stmts:
+            if isinstance(s, x86.X86Instruction):
+                s.args = [esp_relative(a, 4*len(saved) - 4) for a in s.args]
+
+    if stmts and isinstance(stmts[-1], x86.Jmp) and \
+            stmts[-1].args == [return_label(name)]:
+        stmts = stmts[:-1]  # returns right below
+    else:
+        stmts = stmts + [x86.Mov(ext.Const(0), ext.Reg('eax'))]
+
+    if stats is not None:
+        stats['frame'] = [stack_size, 4 * len(saved)]
+
+    prologue = [x86.Directive('align', [16]), x86.Label(name)]
+    if frame:
+        prologue += [
+            x86.Push(ext.Reg('ebp')),
+            x86.Mov(ext.Reg('esp'), ext.Reg('ebp')),
+        ]
+        if stack_size > 0:
+            prologue.append(x86.Sub(ext.Const(stack_size), ext.Reg('esp')))
+    prologue += [x86.Push(reg) for reg in saved]
+
+    epilogue = [x86.Label(return_label(name))]
+    epilogue += [x86.Pop(reg) for reg in reversed(saved)]
+    if frame:
+        epilogue.append(x86.Leave())
+    epilogue.append(x86.Ret())
+
+    return prologue + stmts + epilogue
+
+
+EBP_OFFSET = re.compile(r'^(-?\d+)\(%ebp\)$')
+
+
+def esp_relative(arg, offset):
+    # of an %ebp relative operand, if arg is one
+    match = isinstance(arg, str) and EBP_OFFSET.match(arg)
+    return "{}(%esp)".format(int(match.group(1)) + offset) if match else arg
 
 
 def return_label(func_name):
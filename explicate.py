@@ -92,18 +92,14 @@ class Explicator(ast.NodeTransformer):
         ), bop)
 
     def visit_IfExp(self, ifexp):
-        ifexp = self.generic_visit(ifexp)
-
-        test = self._free_var()
-        return ast.copy_location(ext.Let(test, ifexp.test, ast.IfExp(
-            test_truthy(test),
-            ifexp.body,
-            ifexp.orelse
-        )), ifexp)
+        ifexp.test = self._condition(ifexp.test)
+        ifexp.body = self.visit(ifexp.body)
+        ifexp.orelse = self.visit(ifexp.orelse)
+        return ifexp
 
     def visit_While(self, whl):
-        whl = self.generic_visit(whl)
-        whl.test = test_truthy(whl.test)
+        whl.test = self._condition(whl.test)
+        whl.body = [self.visit(stmt) for stmt in whl.body]
         return whl
 
     def visit_Compare(self, cmp):
@@ -210,6 +206,37 @@ class Explicator(ast.NodeTransformer):
             )
         )))
 
+    def _condition(self, test):
+        # test (not visited yet) as the condition of an if or while: 0 if
+        # false, else not 0. Comparisons are not tagged, and ands, ors and
+        # nots choose between conditions, so that flatten can lower them to
+        # jumps.
+        if isinstance(test, ast.BoolOp):
+            values = [self._condition(v) for v in test.values]
+            if isinstance(test.op, ast.And):
+                return reduce(lambda rest, v: ast.IfExp(
+                    v, rest, ext.Const(0)
+                ), reversed(values))
+            return reduce(lambda rest, v: ast.IfExp(
+                v, ext.Const(1), rest
+            ), reversed(values))
+
+        elif isinstance(test, ast.UnaryOp) and isinstance(test.op, ast.Not):
+            return ast.IfExp(
+                self._condition(test.operand), ext.Const(0), ext.Const(1)
+            )
+        elif isinstance(test, ast.IfExp):
+            return ast.IfExp(*(
+                self._condition(n) for n in (test.test, test.body, test.orelse)
+            ))
+        elif isinstance(test, ast.Compare):
+            return self.visit(test).expr  # untagged
+        elif isinstance(test, ext.Name):
+            return test_truthy(test)
+
+        value = self._free_var()
+        return ext.Let(value, self.visit(test), test_truthy(value))
+
     def _free_var(self):
         self._free_var_ctr += 1
         return ext.Name("#exp{}".format(self._free_var_ctr))
@@ -28,7 +28,7 @@ Name.__new__.__defaults__ = (Name.ANY_COLOR,)
 def ExAstNode(name, fields):
     class EAstNode(ast.AST):
         pass
-    EAstNode.__name__ = name
+    EAstNode.__name__ = EAstNode.__qualname__ = name  # picklable by name
     EAstNode._fields = fields
 
     return EAstNode
@@ -55,12 +55,12 @@ class Closure(
 
 
 class CmpEq(ExAstNode('CmpEq', ['left', 'right', 'negated'])):
-    def __init__(self, left, right, negated=False):
+    def __init__(self, left=None, right=None, negated=False):
         super().__init__(left, right, negated)
 
 
 class CmpLt(ExAstNode('CmpLt', ['left', 'right', 'negated'])):
-    def __init__(self, left, right, negated=False):
+    def __init__(self, left=None, right=None, negated=False):
         super().__init__(left, right, negated)
 
 
@@ -188,8 +188,10 @@ def flatten_Call(call):
         assembly += [
             x86.CallPtr(func),
             # nparams is a tagged int, meaning that since T_INT = 0b00,
-            # nparams = 4 * n_args_untagged. Thus we can do the trick below:
-            x86.Add(nparams, ext.Reg('esp'))
+            # nparams = 4 * n_args_untagged. Thus we can do the trick below
+            # (plus one word for the list of varargs):
+            x86.Add(nparams, ext.Reg('esp')),
+            x86.Add(ext.Const(4), ext.Reg('esp'))
         ]
 
     # print(func, args)
@@ -314,10 +316,11 @@ def flatten_CmpLt(clt):
 
 
 def flatten_IfExp(ifexp):
-    assembly, tt = flatten(ifexp.test)
+    assembly, cond = flatten_condition(ifexp.test)
 
-    if isinstance(tt, ext.Const):
-        return flatten(ifexp.body if tt.value else ifexp.orelse)
+    if isinstance(cond, ext.Const):
+        abranch, tb = flatten(ifexp.body if cond.value else ifexp.orelse)
+        return assembly + abranch, tb
 
     abody, tb = flatten(ifexp.body)
     aorelse, toe = flatten(ifexp.orelse)
@@ -325,13 +328,13 @@ def flatten_IfExp(ifexp):
 
     abody.append(x86.Mov(tb, tret))
     aorelse.append(x86.Mov(toe, tret))
-    assembly.append(x86.If(tt, abody, aorelse))
+    assembly.append(x86.If(cond, abody, aorelse))
 
     return assembly, tret
 
 
 def flatten_While(whl):
-    atest, tt = flatten(whl.test)
+    atest, tt = flatten_condition(whl.test)
     if isinstance(tt, ext.Const) and not tt.value:
         return [], tt
     assembly, tb = [], ext.Const(0)
@@ -341,6 +344,57 @@ def flatten_While(whl):
     return [x86.While(atest, tt, assembly)], tb
 
 
+def flatten_condition(node):
+    # The test of an If or While: returns the assembly computing it and the
+    # condition (see x86ir.Compare) to branch on, so that comparisons jump
+    # on their own flags and ands and ors (unlike as values) short circuit.
+    if isinstance(node, (ext.CmpEq, ext.CmpLt)):
+        left, tl = flatten(node.left)
+        right, tr = flatten(node.right)
+        if isinstance(node, ext.CmpEq):
+            cc = 'ne' if node.negated else 'e'
+        else:
+            cc = 'nl' if node.negated else 'l'
+
+        if isinstance(tl, ext.Const) and isinstance(tr, ext.Const):
+            return left + right, ext.Const(int(x86.CONDITIONS[cc](
+                tl.value, tr.value
+            )))
+        elif isinstance(tl, ext.Const):
+            tl, tr, cc = tr, tl, x86.SWAPPED_CC[cc]
+        return left + right, x86.Compare(cc, tl, tr)
+
+    elif isinstance(node, ast.BoolOp):
+        cond = flatten_condition(node.values[-1])
+        for v in reversed(node.values[:-1]):
+            if isinstance(node.op, ast.And):
+                cond = choice(flatten_condition(v), cond, ([], ext.Const(0)))
+            else:
+                cond = choice(flatten_condition(v), ([], ext.Const(1)), cond)
+        return cond
+
+    elif isinstance(node, ast.IfExp):
+        return choice(*(
+            flatten_condition(n) for n in (node.test, node.body, node.orelse)
+        ))
+
+    elif isinstance(node, ext.Let):
+        e_assembly, tmpe = flatten(node.expr)
+        assembly, cond = flatten_condition(node.body)
+        return e_assembly + [x86.Mov(tmpe, node.name)] + assembly, cond
+
+    return flatten(node)  # a value
+
+
+def choice(test, body, orelse):
+    # (assembly, condition) pairs
+    assembly, cond = test
+    if isinstance(cond, ext.Const):
+        branch_assembly, branch = body if cond.value else orelse
+        return assembly + branch_assembly, branch
+    return [], x86.Choice(test, body, orelse)
+
+
 def flatten_Subscript(subs):
     return flatten(ast.Call(
         ast.Name('__get_subscript', ast.Load()), [subs.value, subs.slice], []
@@ -70,7 +70,8 @@ class Heapifier(ast.NodeTransformer):
 
         lda = self.generic_visit(lda)
 
-        setattr(lda, 'free_vars', visitor.free_vars())
+        # sorted, so that the output doesn't depend on the hash seed
+        setattr(lda, 'free_vars', sorted(visitor.free_vars()))
 
         free_params = [
             arg.arg for arg in lda.args.args if arg.arg in self.free_vars
@@ -97,7 +98,7 @@ class Heapifier(ast.NodeTransformer):
                 [ast.Name(name, ast.Store())],
                 ast.List([ast.Num(0)], ast.Load())
             )
-            for name in visitor.local_vars() if name in self.free_vars
+            for name in sorted(visitor.local_vars()) if name in self.free_vars
         ] + lda.body
 
         # for arg in lda.args:
@@ -0,0 +1,85 @@
+import ast
+import json
+
+import extendedast as ext
+from constants import BUILTIN_FUNCS
+
+
+def canonicalize_function(f):
+    # Renames (in place) the variables of f in order of first occurrence, and
+    # the function labels to placeholders, so that the same function gets the
+    # same key wherever it is in the program (the uniqifier's, explicator's
+    # and closure conversion's counters are global). Returns the labels.
+    names, labels, renamed = {}, [], set()
+
+    def var(name):
+        if name in BUILTIN_FUNCS:
+            return name
+        return names.setdefault(name, 'v{}'.format(len(names)))
+
+    def label(name):
+        if name not in labels:
+            labels.append(name)
+        return label_placeholder(labels.index(name))
+
+    def rename(node):
+        if isinstance(node, ext.Name):
+            return node._replace(id=var(node.id))
+        elif isinstance(node, list):
+            return [rename(n) for n in node]
+        elif not isinstance(node, ast.AST) or id(node) in renamed:
+            return node  # explicate shares subtrees, rename them only once
+        renamed.add(id(node))
+
+        if isinstance(node, ast.Name):
+            node.id = var(node.id)
+        elif isinstance(node, ext.Function):
+            node.name = label(node.name)
+            node.args = [var(a) for a in node.args]
+            node.body = rename(node.body)
+        elif isinstance(node, ext.Return):
+            node.value = rename(node.value)
+            node.func_name = label(node.func_name)
+        elif isinstance(node, ext.Closure):
+            node.func = label(node.func)
+            # keeps the (sorted) order in which the closure's fvs get built
+            node.free_vars = [var(v) for v in node.free_vars]
+        else:
+            for field, value in ast.iter_fields(node):
+                setattr(node, field, rename(value))
+        return node
+
+    rename(f)
+    return labels
+
+
+def label_placeholder(index):
+    return '@{}@'.format(index)  # '@' never appears in our assembly
+
+
+def relabel(text, labels):
+    for i, name in enumerate(labels):
+        text = text.replace(label_placeholder(i), name)
+    return text.split('\n')
+
+
+def compile_functions_cached(funcs, cache, compile_functions, options=''):
+    # the (instructions, statistics) of every function, as compile_functions
+    # returns them, but for the lines of the instructions
+    labels = [canonicalize_function(f) for f in funcs]
+    keys = [cache.key(ast.dump(f), options) for f in funcs]
+    compiled = [cache.get(key) for key in keys]
+    compiled = [c and json.loads(c) for c in compiled]
+
+    misses = [i for i, c in enumerate(compiled) if c is None]
+    for i, (lines, stats) in zip(
+        misses, compile_functions([funcs[i] for i in misses])
+    ):
+        compiled[i] = {'assembly': '\n'.join(map(str, lines)), 'stats': stats}
+        cache.put(keys[i], json.dumps(compiled[i]), flush=False)
+    cache.flush()
+
+    return [
+        (relabel(c['assembly'], l), c['stats'])
+        for c, l in zip(compiled, labels)
+    ]
@@ -0,0 +1,114 @@
+import ast
+import json
+import time
+import tracemalloc
+from collections import OrderedDict, namedtuple
+
+import x86ir as x86
+from cfg import CFG
+
+
+PassRecord = namedtuple(
+    'PassRecord', ['name', 'function', 'seconds', 'peak_memory', 'ir_size']
+)
+
+
+class PassRecorder:
+
+    def __init__(self, timing=True, memory=False):
+        self.timing = timing
+        self.memory = memory
+        self.records = []
+
+    def stage(self, name, func, function=None):
+        def timed(*args):
+            if self.memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                tracemalloc.clear_traces()  # also resets the peak
+            start = time.perf_counter()
+            res = func(*args)
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.memory else None
+            self.records.append(PassRecord(
+                name, function, seconds, peak, ir_size(res)
+            ))
+            return res
+        return timed
+
+    def summary(self):
+        passes = OrderedDict()
+        for r in self.records:
+            p = passes.setdefault(r.name, PassRecord(r.name, None, 0, None, 0))
+            passes[r.name] = p._replace(
+                seconds=p.seconds + r.seconds,
+                peak_memory=max_or_none(p.peak_memory, r.peak_memory),
+                ir_size=p.ir_size + r.ir_size
+            )
+        return list(passes.values())
+
+    def to_json(self):
+        return json.dumps({
+            'passes': [r._asdict() for r in self.summary()],
+            'records': [r._asdict() for r in self.records]
+        }, indent=2)
+
+    def to_table(self):
+        header = ['pass', 'function', 'time (ms)']
+        if self.memory:
+            header.append('peak (KiB)')
+        header.append('IR size')
+
+        def row(r):
+            cells = [r.name, r.function or '*', '{:.2f}'.format(1e3*r.seconds)]
+            if self.memory:
+                cells.append('{:.1f}'.format(r.peak_memory / 1024))
+            cells.append(str(r.ir_size))
+            return cells
+
+        summary = self.summary()
+        total = sum(r.seconds for r in summary)
+        rows = [row(r) for r in summary] + [
+            ['total', '*', '{:.2f}'.format(1e3*total)]
+            + [''] * (len(header) - 3)
+        ]
+        if any(r.function for r in self.records):
+            rows += [None] + [row(r) for r in self.records if r.function]
+
+        widths = [
+            max(len(c[i]) for c in [header] + [r for r in rows if r])
+            for i in range(len(header))
+        ]
+        fmt = '  '.join(
+            '{:<%d}' % w if i < 2 else '{:>%d}' % w
+            for i, w in enumerate(widths)
+        )
+        rule = '-' * len(fmt.format(*header))
+        return '\n'.join([fmt.format(*header), rule] + [
+            fmt.format(*r) if r else rule for r in rows
+        ])
+
+
+def max_or_none(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def ir_size(ir):
+    # AST nodes for the frontend, instructions for the backend
+    if isinstance(ir, ast.AST):
+        return sum(1 for _ in ast.walk(ir))
+    elif isinstance(ir, (x86.X86Instruction, x86.Label, x86.Directive)):
+        return 1
+    elif isinstance(ir, x86.If):
+        return 1 + ir_size(ir.body) + ir_size(ir.orelse)
+    elif isinstance(ir, x86.While):
+        return 1 + ir_size(ir.tasm) + ir_size(ir.body)
+    elif isinstance(ir, CFG):
+        return sum(1 + ir_size(block.stmts) for block in ir.blocks)
+    elif isinstance(ir, (list, tuple)):
+        return sum(ir_size(i) for i in ir)
+    elif isinstance(ir, str):
+        return ir.count('\n') + 1
+    elif isinstance(ir, int):
+        return 0  # e.g. the stack size returned by allocate_memory
+    return 1
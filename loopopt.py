@@ -0,0 +1,523 @@
+from collections import Counter
+
+import constants as C
+import extendedast as ext
+import x86ir as x86
+from cfg import BasicBlock
+from constprop import ConstantPropagation, FOLDS, is_int, propagate_constants
+from dataflow import solve_liveness
+from deadcode import writes_flags
+
+
+# Loop optimizations over the CFG of a function, after constant propagation.
+# The innermost loops whose branches only depend on constants, and that go
+# around a few times, are unrolled: as many copies of their iterations are
+# put in front of them, then propagating constants again folds the tests of
+# the copies and removes the loop left. In the other loops, what computes the
+# same value on every iteration moves to the preheader: the pure instructions
+# only reading names the loop doesn't write (tag extractions, untaggings,
+# constants), and in the header, the calls of the runtime functions only
+# reading immutable objects (lists never change length, nor closures).
+# Last, in the loops going on while i < len(l), where i starts at an int >= 0
+# and only grows by ints, and l is a name they don't write, the subscripts
+# l[i] (with i as at the test) load from the data of the list directly,
+# without get_subscript's dispatch on the tags or its bounds check: len(l)
+# checked that l is a list, and the test that i is in its bounds. The data
+# pointer of l is loaded once, in the preheader.
+
+UNROLL_TRIPS = 16  # at most
+UNROLL_SIZE = 128  # instructions in the copies, at most
+
+PURE_INSTRUCTIONS = (x86.Mov, x86.Neg) + tuple(FOLDS)
+PURE_FUNCS = ('list_size', 'get_fun_ptr', 'get_free_vars', 'get_nparams')
+
+# the data pointer of a list, from its tagged pointer (a big_pyobj starts
+# with its type tag, an int, then the list: data then len)
+LIST_DATA = 4 - C.T_BIG
+MAX_STEP = 1 << 16  # added to i by a write, so that it never wraps around
+
+
+def optimize_loops(cfg, func_args=None, stats=None):
+    # In place. The numbers of loops unrolled, of instructions hoisted and
+    # of subscripts made loads go in stats, for pyyc --debug.
+    n_unrolled = unroll_loops(cfg, func_args)
+    if n_unrolled:
+        propagate_constants(cfg, func_args)
+    n_hoisted = hoist_invariants(cfg)
+    n_loads = load_subscripts(cfg, func_args)
+    if stats is not None:
+        stats['loops'] = [n_unrolled, n_hoisted, n_loads]
+    return cfg
+
+
+def unroll_loops(cfg, func_args):
+    # returns how many were
+    propagation = ConstantPropagation(cfg, func_args)
+    propagation.solve()
+
+    loops = cfg.natural_loops()
+    headers = set(loop.header for loop in loops)
+    n_unrolled = 0
+    for loop in loops:
+        preheader = loop.preheader()
+        if preheader not in propagation.states or \
+                len(headers & loop.blocks) > 1:  # not innermost
+            continue
+
+        trips = PathRun().trip_count(
+            loop, entry_state(propagation, preheader)
+        )
+
+        size = sum(len(b.stmts) for b in loop.blocks)
+        if trips and trips * size <= UNROLL_SIZE:
+            peel(cfg, loop, preheader, trips)
+            n_unrolled += 1
+    return n_unrolled
+
+
+def entry_state(propagation, preheader):
+    # the constants at the end of preheader, with the defined once names
+    # (as copies of the loop will define them again)
+    state = dict(propagation.values)
+    state.update(propagation.states[preheader])
+    run = PathRun()
+    for s in preheader.stmts:
+        run.transfer(s, state)
+    return state
+
+
+class PathRun(ConstantPropagation):
+    # The transfer functions of constant propagation, along the one path
+    # the constants take: every name has its value in the state.
+
+    def __init__(self):
+        self.defined_once = set()
+
+    def trip_count(self, loop, state):
+        # how many times the body of loop runs from state (at the end of its
+        # preheader), None if not only decided by constants, or more than
+        # UNROLL_TRIPS times
+        block, trips = loop.header, 0
+        while True:
+            for s in block.stmts:
+                if isinstance(s, x86.Jmp):  # a return
+                    return None
+                self.transfer(s, state)
+
+            if block.test is None:
+                succ = block.succs[0]
+            else:
+                test = self.test_value(block.test, state)
+                if not is_int(test):
+                    return None
+                succ = block.succs[0] if test.value else block.succs[1]
+
+            if succ not in loop.blocks:
+                return trips
+            elif succ is loop.header:
+                trips += 1
+                if trips > UNROLL_TRIPS:
+                    return None
+            block = succ
+
+
+def peel(cfg, loop, preheader, n):
+    # puts n copies of the iterations of loop before it, the first one
+    # entered from preheader, and each one going around to the next
+    blocks = sorted(loop.blocks, key=lambda b: b.index)
+    copies = [{b: BasicBlock(None) for b in blocks} for _ in range(n)]
+    for i, copy in enumerate(copies):
+        following = copies[i + 1][loop.header] if i + 1 < n else loop.header
+        for block in blocks:
+            c = copy[block]
+            c.stmts = [
+                x86.X86Instruction.copy(s)
+                if isinstance(s, x86.X86Instruction) else s
+                for s in block.stmts
+            ]
+            c.test = block.test
+            for succ in block.succs:
+                c.link(following if succ is loop.header
+                       else copy.get(succ, succ))
+
+    loop.header.preds.remove(preheader)
+    preheader.succs = []
+    preheader.link(copies[0][loop.header])
+    cfg.place_before(loop.header, [c[b] for c in copies for b in blocks])
+
+
+def hoist_invariants(cfg):
+    # returns how many instructions moved to the preheaders of the loops
+    ids = {}
+
+    def operands(inst):
+        return (
+            [ids.setdefault(a, len(ids)) for a in inst.read_args()],
+            [ids.setdefault(a, len(ids)) for a in inst.written_args()]
+        )
+
+    def test_bits(test):
+        if isinstance(test, ext.Name):
+            return 1 << ids.setdefault(test, len(ids))
+        return 0
+
+    # (what moves to a preheader is still defined before it is read, and
+    # read where it was, so the liveness at the headers stays the same)
+    solve_liveness(cfg.blocks, operands, test_bits)
+
+    n_hoisted = 0
+    for loop in cfg.natural_loops():  # the inner ones first
+        preheader = loop.preheader()
+        if preheader is None:
+            continue
+
+        def live_at_header(name):
+            # the value from the iteration before (or the preheader) is read
+            return name in ids and loop.header.live_in >> ids[name] & 1
+
+        blocks = sorted(loop.blocks, key=lambda b: b.index)
+        changed = True
+        while changed:
+            changed = False
+            written = Counter(
+                name for b in blocks for s in b.stmts
+                for name in s.written_args()
+            )
+            read = set(
+                name for b in blocks for s in b.stmts
+                for name in s.read_args()
+            ) | set(b.test for b in blocks)
+            for block in blocks:
+                hoisted = invariant_definitions(
+                    block, block is loop.header, written, read,
+                    live_at_header
+                )
+                if hoisted:
+                    preheader.stmts.extend(block.stmts[i] for i in hoisted)
+                    block.stmts = [
+                        s for i, s in enumerate(block.stmts)
+                        if i not in hoisted
+                    ]
+                    n_hoisted += len(hoisted)
+                    changed = True
+    return n_hoisted
+
+
+def invariant_definitions(block, is_header, written, read, live_at_header):
+    # The indices (in order) of the instructions of block computing names
+    # the same way on every iteration: all the loop's definitions of the
+    # name, pure and only reading names the loop doesn't write (or the name
+    # itself, in order), so that the name has that value wherever the loop
+    # reads it.
+    stmts = block.stmts
+
+    def invariant(arg):
+        return is_int(arg) or isinstance(arg, ext.Name) and not written[arg]
+
+    # whether the flags of each instruction may be read (by a setX after it,
+    # or the branch)
+    flags_read, reading = [], isinstance(block.test, x86.Flags)
+    for s in reversed(stmts):
+        flags_read.append(reading)
+        if isinstance(s, tuple(x86.CmpResult.comparators)):
+            reading = True
+        elif writes_flags(s):
+            reading = False
+    flags_read.reverse()
+
+    definitions = {}
+    for i, s in enumerate(stmts):
+        for name in s.written_args():
+            definitions.setdefault(name, []).append(i)
+
+    hoisted = set()
+    for name, indices in definitions.items():
+        if written[name] != len(indices) or name not in read or \
+                live_at_header(name):
+            continue
+        elif any(
+            name in stmts[i].read_args()
+            for i in range(indices[0], indices[-1]) if i not in indices
+        ):
+            continue  # in between, its value isn't the final one
+
+        first = stmts[indices[0]]
+        group = pure_call(stmts, indices[0]) if is_header else None
+        if group is not None and len(indices) == 1 and \
+                invariant(stmts[group[0]].args[0]) and \
+                all(is_pure(s) for s in stmts[:group[0]]):
+            # (nothing with an effect before it, in the header, so that the
+            # call only moves to run once when the loop is entered)
+            indices = group
+        elif not all(
+            isinstance(stmts[i], PURE_INSTRUCTIONS) and all(
+                arg == name or invariant(arg) for arg in stmts[i].args
+            ) for i in indices
+        ):
+            continue
+        elif len(indices) == 1 and isinstance(first, x86.Mov) and \
+                isinstance(first.args[0], ext.Name):
+            continue  # a copy: only one more name live through the loop
+
+        if not any(
+            writes_flags(stmts[i]) and flags_read[i] for i in indices
+        ):
+            hoisted.update(indices)
+    return sorted(hoisted)
+
+
+def load_subscripts(cfg, func_args):
+    # returns how many subscripts were made loads
+    propagation = ConstantPropagation(cfg, func_args)
+    propagation.solve()
+
+    n_loads = 0
+    for loop in cfg.natural_loops():
+        preheader = loop.preheader()
+        if preheader not in propagation.states:
+            continue
+        written = Counter(
+            name for b in loop.blocks for s in b.stmts
+            for name in s.written_args()
+        )
+        bound = list_bound(loop, preheader, written)
+        if bound is None:
+            continue
+        i, lst = bound
+        start = entry_state(propagation, preheader).get(i)
+        if not is_int(start) or start.value < 0 or \
+                start.value & C.TAG_MASK != C.T_INT or \
+                not only_grows(loop, i):
+            continue
+
+        # forwards, from the test: the names that are i plus some offset,
+        # the same on every path
+        body = loop.header.succs[0]
+        blocks = sorted(loop.blocks - {loop.header}, key=lambda b: b.index)
+        offsets = {}  # at the end of the blocks
+        changed = True
+        while changed:
+            changed = False
+            for block in blocks:
+                before = block_offsets(block, body, i, offsets)
+                if before is None:
+                    continue  # not reached yet
+                for s in block.stmts:
+                    step_offsets(s, before)
+                if offsets.get(block) != before:
+                    offsets[block] = before
+                    changed = True
+
+        data = _new_data()
+        n_loop_loads = sum(
+            load_block_subscripts(
+                block, block_offsets(block, body, i, offsets), lst, data
+            ) for block in blocks
+        )
+        if n_loop_loads:
+            base = _new_unspillable()
+            preheader.stmts += [
+                x86.Mov(lst, base),
+                x86.Load(LIST_DATA, base, None, base),
+                x86.Mov(base, data)
+            ]
+        n_loads += n_loop_loads
+    return n_loads
+
+
+def list_bound(loop, preheader, written):
+    # (i, l) if the header of loop only goes on into it while i < len(l),
+    # both names, l one the loop doesn't write
+    header = loop.header
+    if not header.stmts or not isinstance(header.stmts[-1], x86.Cmp) or \
+            header.test not in (x86.Flags('l'), x86.Flags('g')) or \
+            header.succs[0] not in loop.blocks or \
+            header.succs[1] in loop.blocks or \
+            header.succs[0].preds != [header]:
+        return None
+
+    # cmpl a, b: b < a, or a < b
+    k = len(header.stmts) - 1
+    a, b = header.stmts[k].args
+    i, n = (b, a) if header.test.cc == 'l' else (a, b)
+    if not isinstance(i, ext.Name) or not isinstance(n, ext.Name):
+        return None
+    i, n = copy_source(header.stmts, k, i), copy_source(header.stmts, k, n)
+
+    # n is len(l), computed in the header, or before the loop
+    for block, n_writes in ((header, 1), (preheader, 0)):
+        stmts = block.stmts[:k] if block is header else block.stmts
+        defs = [m for m, s in enumerate(stmts) if n in s.written_args()]
+        if defs:
+            break
+    else:
+        return None
+    group = pure_call(stmts, defs[-1])
+    if group is None or written[n] != n_writes or \
+            stmts[group[1]].args[0] != 'list_size':
+        return None
+    lst = stmts[group[0]].args[0]
+    if not isinstance(lst, ext.Name) or written[lst] or any(
+        lst in s.written_args() for s in stmts[group[0]:]
+    ):
+        return None
+    return i, lst
+
+
+def copy_source(stmts, k, name):
+    # the name that name is a copy of before stmts[k], in their block, and
+    # which has the same value until there
+    for m in reversed(range(k)):
+        s = stmts[m]
+        if name in s.written_args():
+            src = s.args[0]
+            if not isinstance(s, x86.Mov) or not isinstance(src, ext.Name) \
+                    or any(src in t.written_args() for t in stmts[m + 1:k]):
+                break
+            name = src
+    return name
+
+
+def only_grows(loop, i):
+    # whether the loop only adds ints from 0 to MAX_STEP to i
+    for block in loop.blocks:
+        offsets = {i: 0}
+        for s in block.stmts:
+            before = offsets.get(i)
+            step_offsets(s, offsets)
+            if i in s.written_args():
+                after = offsets.get(i)
+                if after is None or not 0 <= after - before <= MAX_STEP or \
+                        (after - before) & C.TAG_MASK:
+                    return False
+    return True
+
+
+def step_offsets(s, offsets):
+    # In place: offsets are (name: c) for the names some value plus c, after
+    # s as they were before.
+    dst = s.args[-1] if s.args else None
+    if isinstance(s, x86.Mov) and isinstance(dst, ext.Name) and \
+            s.args[0] in offsets:
+        offsets[dst] = offsets[s.args[0]]
+    elif isinstance(s, x86.Add) and is_int(s.args[0]) and dst in offsets:
+        offsets[dst] += s.args[0].value
+    else:
+        for name in s.written_args():
+            offsets.pop(name, None)
+
+
+def block_offsets(block, body, i, offsets):
+    # at the start of block, from the ends of the preds reached (None for
+    # none)
+    if block is body:
+        return {i: 0}
+    reached = [offsets[p] for p in block.preds if p in offsets]
+    if not reached:
+        return None
+    return dict(
+        (name, c) for name, c in reached[0].items()
+        if all(o.get(name) == c for o in reached[1:])
+    )
+
+
+def load_block_subscripts(block, offsets, lst, data):
+    # In place: the get_subscript calls of block on lst (or a copy of it)
+    # and i as at the test (offsets being at its start) become loads from
+    # data, the data pointer of lst. Up to a call, they share the register
+    # it is moved to. Returns how many.
+    if offsets is None:
+        return 0
+    lists = {lst}
+    stmts, new_statements, n_loads = block.stmts, [], 0
+    base = None
+    k = 0
+    while k < len(stmts):
+        call = subscript_call(stmts, k)
+        if call is not None and offsets.get(call[0]) == 0 and \
+                call[1] in lists:
+            index, _, result = call
+            if base is None:
+                base = _new_unspillable()
+                new_statements.append(x86.Mov(data, base))
+            offset = _new_unspillable()
+            new_statements += [
+                x86.Mov(index, offset),
+                x86.Load(0, base, offset, offset),
+                x86.Mov(offset, result)
+            ]
+            offsets.pop(result, None)
+            lists.discard(result)
+            n_loads += 1
+            k += 5
+            continue
+
+        s = stmts[k]
+        if isinstance(s, x86.Call):
+            base = None  # not kept in a register across it
+        step_offsets(s, offsets)
+        written = s.written_args()
+        if isinstance(s, x86.Mov) and s.args[0] in lists:
+            lists |= written
+        else:
+            lists -= written
+        new_statements.append(s)
+        k += 1
+    block.stmts = new_statements
+    return n_loads
+
+
+def subscript_call(stmts, k):
+    # (index, container, result) if stmts[k] starts a call of get_subscript
+    push_index, push_container, call, pop, move = (
+        stmts[k:k + 5] + [None] * 5
+    )[:5]
+    if isinstance(push_index, x86.Push) and \
+            isinstance(push_container, x86.Push) and \
+            type(call) is x86.Call and call.args[0] == 'get_subscript' and \
+            isinstance(pop, x86.Add) and \
+            pop.args == [ext.Const(8), ext.Reg('esp')] and \
+            isinstance(move, x86.Mov) and \
+            move.args[0] == ext.Reg('eax') and \
+            isinstance(move.args[1], ext.Name):
+        return push_index.args[0], push_container.args[0], move.args[1]
+    return None
+
+
+def pure_call(stmts, i):
+    # the indices of the pushl, call, addl and movl of a call of one of the
+    # PURE_FUNCS whose result stmts[i] moves to a name
+    if i < 3:
+        return None
+    push, call, pop, move = stmts[i - 3:i + 1]
+    if isinstance(push, x86.Push) and type(call) is x86.Call and \
+            call.args[0] in PURE_FUNCS and isinstance(pop, x86.Add) and \
+            pop.args == [ext.Const(4), ext.Reg('esp')] and \
+            isinstance(move, x86.Mov) and move.args[0] == ext.Reg('eax'):
+        return list(range(i - 3, i + 1))
+    return None
+
+
+def is_pure(s):
+    # writes no more than names, or the flags
+    return isinstance(
+        s, PURE_INSTRUCTIONS + (x86.Cmp,) + tuple(x86.CmpResult.comparators)
+    ) and all(not isinstance(arg, ext.Reg) for arg in s.args)
+
+
+def _new_unspillable():
+    _new_unspillable.ctr += 1
+    # lpou - loop optimization unspillable
+    return ext.Name('#lpou{}'.format(_new_unspillable.ctr), max_color=C.N_REGS)
+
+
+_new_unspillable.ctr = 0
+
+
+def _new_data():
+    _new_data.ctr += 1
+    # lpod - loop optimization data pointer
+    return ext.Name('#lpod{}'.format(_new_data.ctr))
+
+
+_new_data.ctr = 0
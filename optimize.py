@@ -1,10 +1,197 @@
+from collections import Counter
 
-from x86ir import Mov
+import extendedast as ext
+import x86ir as x86
+from constants import CSAVE_REGS
+from constprop import wrap
 
 
-def remove_useless_moves(statements):
-    return [s for s in statements if not is_useless_move(s)]
+def peephole_optimize(statements, stats=None):
+    # Rewrites the windows of instructions matching one of PEEPHOLES until
+    # none does, over the allocated and laid out instructions of a function.
+    # The number of rewrites of each pattern goes in stats, for pyyc --debug.
+    statements = list(statements)
+    hits = Counter()
+    changed = True
+    while changed:
+        changed = False
+        i = 0
+        while i < len(statements):
+            for name, pattern in PEEPHOLES:
+                rewrite = pattern(statements, i)
+                if rewrite is not None:
+                    n, replacement = rewrite
+                    statements[i:i + n] = replacement
+                    hits[name] += 1
+                    changed = True
+                    break
+            else:
+                i += 1
 
+    if stats is not None:
+        stats['peephole'] = dict(
+            (name, hits[name]) for name, _ in PEEPHOLES if hits[name]
+        )
+    return statements
 
-def is_useless_move(stmt):
-    return isinstance(stmt, Mov) and stmt.args[0] == stmt.args[1]
+
+# A pattern looks at the instructions from statements[i], and returns None if
+# they don't match, else (n, replacement) to replace the n first of them.
+
+def self_move(statements, i):
+    s = statements[i]
+    if isinstance(s, x86.Mov) and s.args[0] == s.args[1]:
+        return 1, []
+
+
+def move_back(statements, i):
+    # movl a, b; movl b, a
+    s, t = window(statements, i, 2)
+    if isinstance(s, x86.Mov) and isinstance(t, x86.Mov) and \
+            t.args == s.args[::-1]:
+        return 2, [s]
+
+
+def move_through(statements, i):
+    # movl a, t; movl t, b with t dead after: movl a, b
+    s, t = window(statements, i, 2)
+    if isinstance(s, x86.Mov) and isinstance(t, x86.Mov) and \
+            s.args[1] == t.args[0] and isinstance(s.args[1], ext.Reg) and \
+            not (is_memory(s.args[0]) and is_memory(t.args[1])) and \
+            is_dead_after(statements, i + 1, s.args[1]):
+        return 2, [x86.Mov(s.args[0], t.args[1])]
+
+
+IDENTITIES = {
+    x86.Add: 0, x86.Sub: 0, x86.Or: 0, x86.Xor: 0, x86.Sal: 0, x86.Sar: 0,
+    x86.And: -1
+}
+
+
+def identity(statements, i):
+    # e.g. the addl $0, %esi of closure calls, or the orl $0 of int tags
+    s = statements[i]
+    if type(s) in IDENTITIES and \
+            s.args[0] == ext.Const(IDENTITIES[type(s)]) and \
+            not flags_read_after(statements, i):
+        return 1, []
+
+
+def shift_back(statements, i):
+    # sarl $k, x; sall $k, x clears the k low bits of x
+    s, t = window(statements, i, 2)
+    if isinstance(s, x86.Sar) and isinstance(t, x86.Sal) and \
+            s.args == t.args and isinstance(s.args[0], ext.Const) and \
+            not flags_read_after(statements, i + 1):
+        return 2, [x86.And(ext.Const(wrap(-1 << s.args[0].value)), s.args[1])]
+
+
+COMBINATIONS = {
+    (x86.Add, x86.Add): (x86.Add, lambda a, b: a + b),
+    (x86.Add, x86.Sub): (x86.Add, lambda a, b: a - b),
+    (x86.Sub, x86.Add): (x86.Add, lambda a, b: b - a),
+    (x86.Sub, x86.Sub): (x86.Sub, lambda a, b: a + b),
+    (x86.Or, x86.Or): (x86.Or, lambda a, b: a | b),
+    (x86.And, x86.And): (x86.And, lambda a, b: a & b),
+    (x86.Xor, x86.Xor): (x86.Xor, lambda a, b: a ^ b),
+}
+
+
+def combine_immediates(statements, i):
+    # e.g. orl $1, x; orl $2, x: orl $3, x
+    s, t = window(statements, i, 2)
+    combination = COMBINATIONS.get((type(s), type(t)))
+    if combination and s.args[1] == t.args[1] and \
+            isinstance(s.args[0], ext.Const) and \
+            isinstance(t.args[0], ext.Const) and \
+            not flags_read_after(statements, i + 1):
+        op, combine = combination
+        return 2, [op(
+            ext.Const(wrap(combine(s.args[0].value, t.args[0].value))),
+            s.args[1]
+        )]
+
+
+def branch_over_jump(statements, i):
+    # jcc L1; jmp L2; L1: jncc L2; L1:
+    s, t = window(statements, i, 2)
+    if type(s) in CONDITION_CODES and isinstance(t, x86.Jmp) and \
+            s.args[0] in labels_after(statements, i + 1):
+        negated = x86.CondJump.jumps[x86.NEGATED_CC[CONDITION_CODES[type(s)]]]
+        return 2, [negated(t.args[0])]
+
+
+def jump_to_next(statements, i):
+    # a jump to one of the labels right after it, e.g. over the blocks the
+    # other patterns emptied
+    s = statements[i]
+    if isinstance(s, JUMPS) and s.args[0] in labels_after(statements, i):
+        return 1, []
+
+
+PEEPHOLES = [
+    ('self-move', self_move),
+    ('move-back', move_back),
+    ('move-through', move_through),
+    ('identity', identity),
+    ('shift-back', shift_back),
+    ('combine-immediates', combine_immediates),
+    ('branch-over-jump', branch_over_jump),
+    ('jump-to-next', jump_to_next),
+]
+
+
+def window(statements, i, n):
+    # the n statements from i (None past the end)
+    return (statements[i:i + n] + [None] * n)[:n]
+
+
+def is_memory(arg):
+    return isinstance(arg, str)  # a stack slot
+
+
+FLAGS_WRITERS = (x86.Cmp, x86.Call, x86.Add, x86.Sub, x86.Neg, x86.And,
+                 x86.Or, x86.Xor)
+FLAGS_READERS = tuple(x86.CmpResult.comparators) + tuple(
+    x86.CondJump.jumps.values()
+)
+JUMPS = (x86.Jmp,) + tuple(x86.CondJump.jumps.values())
+CONDITION_CODES = dict((jump, cc) for cc, jump in x86.CondJump.jumps.items())
+
+
+def flags_read_after(statements, i):
+    # whether the flags statements[i] sets may be read: not past a label or
+    # a jump, as the flags are only read in the block that sets them (by the
+    # setX after a compare, or the branch remove_ctrl_flow ends it with)
+    for s in statements[i + 1:]:
+        if isinstance(s, FLAGS_READERS):
+            return True
+        elif isinstance(s, FLAGS_WRITERS + (x86.Label, x86.Jmp)):
+            return False
+    return True
+
+
+def labels_after(statements, i):
+    # the names of the labels right after statements[i]
+    names = set()
+    for s in statements[i + 1:]:
+        if not isinstance(s, x86.Label):
+            break
+        names.add(s.name)
+    return names
+
+
+def is_dead_after(statements, i, reg):
+    # whether reg is written before being read after statements[i], in the
+    # same block (calls write the caller save registers)
+    for s in statements[i + 1:]:
+        if not isinstance(s, x86.X86Instruction) or isinstance(s, JUMPS):
+            return False
+        elif reg in s.args and not (
+            isinstance(s, (x86.Mov, x86.Pop)) and s.args[-1] == reg and
+            reg not in s.args[:-1]
+        ):
+            return False
+        elif reg in s.args or isinstance(s, x86.Call) and reg in CSAVE_REGS:
+            return True
+    return False
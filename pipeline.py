@@ -0,0 +1,195 @@
+import ast
+import textwrap
+from functools import partial
+from multiprocessing import Pool
+
+# import astor
+
+import x86ir as x86
+from uniqify import Uniqifier
+from explicate import Explicator
+from heapify import heapify_free_vars
+from closureconv import convert_closures, _new_function
+from closureconv import _free_var as _ccnv_free_var
+from typeinfer import infer_types
+from flatten import flatten
+from flatten import _free_var as _ftn_free_var
+from alloc import allocate_memory, _new_unspillable, _new_split
+from cfg import build_cfg
+from constprop import propagate_constants
+from loopopt import optimize_loops
+from loopopt import _new_unspillable as _lpo_new_unspillable
+from loopopt import _new_data as _lpo_new_data
+from deadcode import eliminate_dead_code
+from remcf import remove_ctrl_flow
+from optimize import peephole_optimize
+from defunctioning import wrap_function
+from instrument import PassRecorder
+from incremental import compile_functions_cached
+
+
+def call_in_succession(*funcs):
+    def func(*args):
+        res = args
+        for f in funcs:
+            if not isinstance(res, tuple):
+                res = res,
+            res = f(*res)
+        return res
+    return func
+
+
+def print_function(f):
+    import astor
+
+    print(f.name, f.args)
+    print('    ' + astor.dump_tree(f.body))
+    print()
+    return f
+
+
+def print_x86ir(x86ir):
+    print(x86.dump(x86ir))
+    return x86ir
+
+
+def join_program(main, functions):
+    return textwrap.dedent("""
+        .globl {}
+        {}
+    """).lstrip().format(main, '\n\n'.join(
+        ('\n'.join(map(str, f)) for f in functions))
+    )
+
+
+def modify_index(index, func):
+    def modifier(*args):
+        return tuple(func(a) if i == index else a for i, a in enumerate(args))
+    return modifier
+
+
+def modify_attr(name, func):
+    def modifier(obj):
+        setattr(obj, name, func(getattr(obj, name)))
+        return obj
+    return modifier
+
+
+# module-level name generators, reset before each compilation so that the
+# output only depends on the source (e.g. in a long-lived compile server).
+# The backend ones are also reset for every function: each function is its
+# own naming namespace, so functions can be compiled in any order/process.
+FRONTEND_COUNTERS = (_new_function, _ccnv_free_var)
+BACKEND_COUNTERS = (
+    _ftn_free_var, _lpo_new_unspillable, _lpo_new_data, _new_unspillable,
+    _new_split
+)
+
+
+def reset_counters(counters=FRONTEND_COUNTERS + BACKEND_COUNTERS):
+    for counter in counters:
+        counter.ctr = 0
+
+
+def pycompile(
+    source, recorder=None, jobs=1, cache=None, regalloc='graph', stats=None
+):
+    # stats, if a list, gets the (name, statistics) of every function, for
+    # pyyc --debug
+    reset_counters()
+    stage = recorder.stage if recorder else no_stage
+
+    def compile_and_collect(funcs):
+        names = [f.name for f in funcs]  # before the cache renames them
+        compiled = compile_functions(funcs, recorder, jobs, cache, regalloc)
+        if stats is not None:
+            stats.extend(zip(names, (s for _, s in compiled)))
+        return [lines for lines, _ in compiled]
+
+    return call_in_succession(
+        stage('parse', ast.parse),
+        # partial(astor.dump_tree, indentation='  ')
+        stage('uniqify', lambda tree: Uniqifier().visit(tree)),
+        # astor.to_source,
+        stage('explicate', lambda tree: Explicator().visit(tree)),
+        stage('heapify', heapify_free_vars),
+        stage('convert_closures', convert_closures),
+        modify_index(1, compile_and_collect),
+        stage('join_program', join_program)
+    )(source)
+
+
+def compile_functions(
+    funcs, recorder=None, jobs=1, cache=None, regalloc='graph'
+):
+    # the (instructions, statistics) of every function
+    if cache is not None:
+        return compile_functions_cached(funcs, cache, partial(
+            compile_functions, recorder=recorder, jobs=jobs, regalloc=regalloc
+        ), options='regalloc={}'.format(regalloc))
+
+    if jobs <= 1 or len(funcs) <= 1:
+        return [compile_function(f, recorder, regalloc) for f in funcs]
+
+    with Pool(min(jobs, len(funcs))) as pool:
+        results = list(pool.imap(_compile_function_job, [
+            (f, recorder and (recorder.timing, recorder.memory), regalloc)
+            for f in funcs
+        ]))
+
+    if recorder:
+        recorder.records.extend(
+            r for _, _, records in results for r in records
+        )
+    return [(lines, stats) for lines, stats, _ in results]
+
+
+def _compile_function_job(job):
+    # x86 instructions don't pickle, so workers send back the assembly lines
+    f, recording, regalloc = job
+    recorder = recording and PassRecorder(*recording)
+    instructions, stats = compile_function(f, recorder, regalloc)
+    lines = [str(i) for i in instructions]
+    return lines, stats, recorder.records if recorder else []
+
+
+def compile_function(f, recorder=None, regalloc='graph'):
+    # returns the instructions of f, and the statistics of its passes
+    reset_counters(BACKEND_COUNTERS)
+    stage = partial(recorder.stage, function=f.name) if recorder else no_stage
+    stats = {}
+
+    instructions = call_in_succession(
+        # print_function,
+        modify_attr('body', call_in_succession(
+            stage('infer_types', infer_types),
+            stage('flatten', lambda body: [
+                s for stmt in body for s in flatten(stmt)[0]
+            ]),
+            stage('build_cfg', build_cfg),
+            stage('propagate_constants', lambda cfg: propagate_constants(
+                cfg, f.args
+            )),
+            stage('optimize_loops', lambda cfg: optimize_loops(
+                cfg, f.args, stats
+            )),
+            stage('eliminate_dead_code', partial(
+                eliminate_dead_code, func_name=f.name, stats=stats
+            )),
+            stage('allocate_memory', lambda cfg: allocate_memory(
+                cfg, f.args, regalloc
+            )),
+            modify_index(0, stage('remove_ctrl_flow', partial(
+                remove_ctrl_flow, func_name=f.name
+            ))),
+            modify_index(0, stage('peephole_optimize', partial(
+                peephole_optimize, stats=stats
+            )))
+        )),
+        stage('wrap_function', partial(wrap_function, stats=stats))
+    )(f)
+    return instructions, stats
+
+
+def no_stage(name, func):
+    return func
@@ -1,118 +1,314 @@
 #!/usr/bin/env python3
 
-import ast
-import textwrap
-from functools import partial
-
-# import astor
-
-import x86ir as x86
-from uniqify import Uniqifier
-from explicate import Explicator
-from heapify import heapify_free_vars
-from closureconv import convert_closures
-from flatten import flatten
-from alloc import allocate_memory
-from remcf import remove_ctrl_flow
-from optimize import remove_useless_moves
-from defunctioning import wrap_function
-
-
-def call_in_succession(*funcs):
-    def func(*args):
-        res = args
-        for f in funcs:
-            if not isinstance(res, tuple):
-                res = res,
-            res = f(*res)
-        return res
-    return func
-
-
-def print_function(f):
-    import astor
-
-    print(f.name, f.args)
-    print('    ' + astor.dump_tree(f.body))
-    print()
-    return f
-
-
-def print_x86ir(x86ir):
-    print(x86.dump(x86ir))
-    return x86ir
-
-
-def join_program(main, functions):
-    return textwrap.dedent("""
-        .globl {}
-        {}
-    """).lstrip().format(main, '\n\n'.join(
-        ('\n'.join(map(str, f)) for f in functions))
+import json
+import os
+import sys
+
+# Only the standard library is imported up front: when a compile server is
+# running, the passes in pipeline.py are never imported by the client.
+
+
+def compile_source(
+    source, socket_path=None, cache=None, recorder=None, jobs=1,
+    regalloc='graph', server_timeout=None
+):
+    # returns the assembly, and the (name, statistics) of every function
+    if recorder is not None:
+        from pipeline import pycompile
+
+        # always run every pass
+        stats = []
+        return str(pycompile(
+            source, recorder, jobs, regalloc=regalloc, stats=stats
+        )), stats
+
+    if cache is not None:
+        key = cache.key(source, 'regalloc={}'.format(regalloc))
+        compiled = cache.get(key)
+        if compiled is not None:
+            cache.flush()
+            return tuple(json.loads(compiled))
+
+    compiled = _compile_uncached(
+        source, socket_path, jobs, cache and cache.subcache('functions'),
+        regalloc, server_timeout
     )
+    if cache is not None:
+        cache.put(key, json.dumps(compiled))
+    return compiled
+
+
+def _compile_uncached(
+    source, socket_path=None, jobs=1, function_cache=None, regalloc='graph',
+    server_timeout=None
+):
+    if socket_path is not None:
+        from server import REQUEST_TIMEOUT, CompileServerError, \
+            request_compile
+
+        try:
+            compiled = request_compile(
+                source, socket_path, jobs, function_cache, regalloc,
+                server_timeout or REQUEST_TIMEOUT
+            )
+        except CompileServerError as e:
+            sys.exit("pyyc: {}".format(e))
+        if compiled is not None:
+            return compiled
+
+    from pipeline import pycompile
+
+    stats = []
+    return str(pycompile(
+        source, jobs=jobs, cache=function_cache, regalloc=regalloc,
+        stats=stats
+    )), stats
+
+
+def compile_file(pyfile, output, *args, **kwargs):
+    with open(pyfile) as src:
+        assembly, stats = compile_source(src.read(), *args, **kwargs)
+
+    with open(output, 'w') as outfile:
+        outfile.write(assembly)
+    return assembly, stats
+
+
+def find_sources(paths, output_dir=None):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.py'):
+                        pyfile = os.path.join(root, name)
+                        yield pyfile, output_path(
+                            pyfile, output_dir, os.path.relpath(pyfile, path)
+                        )
+        else:
+            yield path, output_path(path, output_dir, os.path.basename(path))
+
+
+def output_path(pyfile, output_dir, relpath):
+    if output_dir is None:
+        return os.path.splitext(pyfile)[0] + '.s'
+    return os.path.join(output_dir, os.path.splitext(relpath)[0] + '.s')
+
+
+def _compile_job(job):
+    pyfile, output, cache, regalloc = job
+    try:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        compile_file(pyfile, output, cache=cache, regalloc=regalloc)
+    except Exception as e:
+        return pyfile, "{}: {}".format(e.__class__.__name__, e)
+    return pyfile, None
+
+
+def compile_batch(jobs, processes=None):
+    from multiprocessing import Pool
+
+    import pipeline  # noqa: F401 (import once, before forking the workers)
 
+    with Pool(processes) as pool:
+        return list(pool.imap(_compile_job, jobs))
+
+
+def print_frame_sizes(stats):
+    for name, s in stats:
+        slots, saved = s['frame']
+        print("{}: {} byte stack frame ({} of spill slots, {} of saved "
+              "registers)".format(name, slots + saved, slots, saved),
+              file=sys.stderr)
+
+
+def print_dead_code_counts(stats):
+    for name, s in stats:
+        print("{}: {} dead instructions removed".format(name, s['dead_code']),
+              file=sys.stderr)
+
+
+def print_loop_counts(stats):
+    for name, s in stats:
+        print("{}: {} loops unrolled, {} invariant instructions hoisted, {} "
+              "subscripts loaded directly".format(name, *s['loops']),
+              file=sys.stderr)
+
+
+def print_peephole_counts(stats):
+    for name, s in stats:
+        hits = s['peephole']
+        print("{}: {} peephole rewrites{}".format(
+            name, sum(hits.values()), ''.join(
+                "\n    {}: {}".format(pattern, n)
+                for pattern, n in hits.items()
+            )
+        ), file=sys.stderr)
+
+
+def print_cache_stats(cache):
+    for cache in (cache, cache.subcache('functions')):
+        stats = cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        print("cache {}: {} hits, {} misses ({:.1%} hit rate), {} entries, "
+              "{:.1f} KiB".format(
+                  cache.path, stats['hits'], stats['misses'],
+                  stats['hits'] / lookups if lookups else 0,
+                  stats['entries'], stats['size'] / 1024
+              ), file=sys.stderr)
 
-def modify_index(index, func):
-    def modifier(*args):
-        return tuple(func(a) if i == index else a for i, a in enumerate(args))
-    return modifier
-
-
-def modify_attr(name, func):
-    def modifier(obj):
-        setattr(obj, name, func(getattr(obj, name)))
-        return obj
-    return modifier
-
-
-pycompile = call_in_succession(
-    ast.parse,
-    # partial(astor.dump_tree, indentation='  ')
-    Uniqifier().visit,
-    # astor.to_source,
-    Explicator().visit,
-    heapify_free_vars,
-    convert_closures,
-    modify_index(1, lambda funcs: [call_in_succession(
-        # print_function,
-        modify_attr('body', call_in_succession(
-            partial(map, flatten),
-            lambda lists: [s for stmts, _ in lists for s in stmts],
-            lambda stmts: allocate_memory(stmts, f.args),
-            modify_index(0, remove_ctrl_flow),
-            modify_index(0, remove_useless_moves)
-        )),
-        wrap_function
-    )(f) for f in funcs]),
-    join_program
-)
 
 if __name__ == "__main__":
 
-    import os
     from argparse import ArgumentParser
 
     parser = ArgumentParser(
-        description="Compile a python file (.py) into x86 assembly (.s)"
+        description="Compile python files (.py) into x86 assembly (.s)"
     )
-    parser.add_argument("pyfile", help="The file to compile.")
+    parser.add_argument("pyfiles", nargs='*', metavar='pyfile',
+                        help="The files (or directories of files) to compile.")
     parser.add_argument('-d', '--debug', action='store_true',
-                        help="Whether to print debug info")
+                        help="Whether to print debug info (e.g. the stack "
+                             "frame of every function)")
     parser.add_argument('--print-assembly', action='store_true',
                         help="Whether to output to console instead of a file")
     parser.add_argument('-o', '--output', help="The file to output.")
+    parser.add_argument('--output-dir',
+                        help="The directory to output to in batch mode.")
+    parser.add_argument('-j', '--jobs', type=int,
+                        help="Number of processes: files are compiled in "
+                             "parallel in batch mode (defaulting to the "
+                             "number of cores), functions otherwise "
+                             "(defaulting to 1).")
+    parser.add_argument('--regalloc', choices=['graph', 'linear'],
+                        help="The register allocator: graph coloring "
+                             "(the default), or a faster linear scan giving "
+                             "slower code.")
+    parser.add_argument('-O', dest='opt_level', type=int, choices=[0, 1],
+                        default=1,
+                        help="-O0 compiles faster, with the linear scan "
+                             "(unless --regalloc says otherwise).")
+    parser.add_argument('--serve', action='store_true',
+                        help="Run a compile server on --socket instead of "
+                             "compiling.")
+    parser.add_argument('--socket',
+                        help="The unix socket of the compile server.")
+    parser.add_argument('--no-server', action='store_true',
+                        help="Always compile in-process.")
+    parser.add_argument('--server-timeout', type=float,
+                        help="Seconds to wait for the compile server before "
+                             "compiling in-process (defaults to 60).")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Bypass the compilation cache.")
+    parser.add_argument('--cache-dir',
+                        help="The compilation cache directory (defaults to "
+                             "$PYYC_CACHE_DIR or ~/.cache/pyyc).")
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help="Size cap of the compilation cache, in MiB.")
+    parser.add_argument('--cache-stats', action='store_true',
+                        help="Report the cache hits and misses.")
+    parser.add_argument('--time-passes', action='store_true',
+                        help="Report the time spent in each pass (compiles "
+                             "in-process, without the cache).")
+    parser.add_argument('--mem-passes', action='store_true',
+                        help="Report the peak memory allocated by each pass "
+                             "(slows the passes down).")
+    parser.add_argument('--pass-stats-format', choices=['table', 'json'],
+                        default='table',
+                        help="Format of the --time-passes/--mem-passes "
+                             "report.")
 
     args = parser.parse_args()
 
-    with open(args.pyfile) as src:
-        compiled = pycompile(src.read())
+    if args.serve:
+        from server import CompileServerError, serve
+        try:
+            serve(args.socket)
+        except CompileServerError as e:
+            sys.exit("pyyc --serve: {}".format(e))
+        sys.exit(0)
+
+    cache = None
+    if not args.no_cache or args.cache_stats:
+        from cache import CompileCache
+        cache = CompileCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    if args.cache_stats and not args.pyfiles:
+        print_cache_stats(cache)
+        sys.exit(0)
+
+    if not args.pyfiles:
+        parser.error("the following arguments are required: pyfile")
+
+    compile_cache = None if args.no_cache else cache
+    regalloc = args.regalloc or ('linear' if args.opt_level == 0 else 'graph')
+
+    batch = len(args.pyfiles) > 1 or os.path.isdir(args.pyfiles[0])
+    if batch and (args.output or args.print_assembly):
+        parser.error("-o and --print-assembly need a single pyfile")
+
+    recorder = None
+    if args.time_passes or args.mem_passes:
+        if batch:
+            parser.error("--time-passes and --mem-passes need a single pyfile")
+
+        from instrument import PassRecorder
+        recorder = PassRecorder(memory=args.mem_passes)
+
+    if batch:
+        jobs = [
+            (pyfile, output, compile_cache, regalloc)
+            for pyfile, output in find_sources(args.pyfiles, args.output_dir)
+        ]
+        failed = [
+            (pyfile, error) for pyfile, error in compile_batch(jobs, args.jobs)
+            if error is not None
+        ]
+        for pyfile, error in failed:
+            print("{}: {}".format(pyfile, error), file=sys.stderr)
+        if args.debug:
+            print("compiled {} of {} files".format(
+                len(jobs) - len(failed), len(jobs)
+            ), file=sys.stderr)
+        if args.cache_stats:
+            print_cache_stats(cache)
+        sys.exit(1 if failed else 0)
+
+    jobs = args.jobs or 1
+    socket_path = None
+    if not args.no_server:
+        from server import default_socket
+        socket_path = args.socket or default_socket()
 
     if args.print_assembly:
-        print(compiled)
+        with open(args.pyfiles[0]) as src:
+            assembly, stats = compile_source(
+                src.read(), socket_path, compile_cache, recorder, jobs,
+                regalloc, args.server_timeout
+            )
+        print(assembly)
 
     else:
 
-        output = args.output or os.path.splitext(args.pyfile)[0] + '.s'
+        output = args.output or next(
+            find_sources(args.pyfiles, args.output_dir)
+        )[1]
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+        assembly, stats = compile_file(
+            args.pyfiles[0], output, socket_path, compile_cache, recorder,
+            jobs, regalloc, args.server_timeout
+        )
+
+    if args.debug:
+        print_frame_sizes(stats)
+        print_loop_counts(stats)
+        print_dead_code_counts(stats)
+        print_peephole_counts(stats)
+
+    if recorder is not None:
+        print(recorder.to_json() if args.pass_stats_format == 'json'
+              else recorder.to_table(), file=sys.stderr)
 
-        with open(output, 'w') as outfile:
-            outfile.write(str(compiled))
+    if args.cache_stats:
+        print_cache_stats(cache)
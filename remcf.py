@@ -1,65 +1,47 @@
-
 import x86ir as x86
 import constants as C
 
 
-def remove_ctrl_flow(stmts):
+def remove_ctrl_flow(cfg, func_name):
+    # Lays the blocks out in order: a branch falls through to the next block
+    # when it can, the blocks jumped to get a label.
+    targets = set()
+    for block, next_block in zip(cfg.blocks, cfg.blocks[1:] + [None]):
+        for succ in block.succs:
+            if succ is not next_block:
+                targets.add(succ)
 
     new_stmts = []
-    for s in stmts:
-
-        if isinstance(s, (x86.If, x86.While)):
-            rem_func = remove_if if isinstance(s, x86.If) else remove_while
-            new_stmts.extend(rem_func(s))
-        else:
-            new_stmts.append(s)
+    for block, next_block in zip(cfg.blocks, cfg.blocks[1:] + [None]):
+        if block in targets:
+            new_stmts.append(x86.Label(_block_label(func_name, block)))
+        new_stmts += block.stmts
+
+        if block.test is not None:
+            taken, not_taken = block.succs
+            if isinstance(block.test, x86.Flags):
+                cc = block.test.cc
+            else:
+                new_stmts.append(x86.Cmp(C.ConstInt(0), block.test))
+                cc = 'ne'
+            jump, jump_not = (
+                x86.CondJump.jumps[c] for c in (cc, x86.NEGATED_CC[cc])
+            )
+            if taken is next_block:
+                new_stmts.append(jump_not(_block_label(func_name, not_taken)))
+            elif not_taken is next_block:
+                new_stmts.append(jump(_block_label(func_name, taken)))
+            else:
+                new_stmts += [
+                    jump_not(_block_label(func_name, not_taken)),
+                    x86.Jmp(_block_label(func_name, taken))
+                ]
+        elif block.succs and block.succs[0] is not next_block:
+            new_stmts.append(x86.Jmp(_block_label(func_name, block.succs[0])))
 
     return new_stmts
 
 
-def remove_if(s):
-    lbl_else, lbl_end = _free_if_labels()
-
-    stmts = [
-        x86.Cmp(C.ConstInt(0), s.test),
-        x86.Je(lbl_else)
-    ]
-
-    stmts += remove_ctrl_flow(s.body)
-    stmts += [
-        x86.Jmp(lbl_end),
-        x86.Label(lbl_else)
-    ]
-    stmts += remove_ctrl_flow(s.orelse)
-    stmts.append(x86.Label(lbl_end))
-
-    return stmts
-
-
-def remove_while(s):
-    lbl_start, lbl_end = _free_while_labels()
-    return (
-        [x86.Label(lbl_start)]
-        + remove_ctrl_flow(s.tasm)
-        + [x86.Cmp("$0", s.test), x86.Je(lbl_end)]
-        + remove_ctrl_flow(s.body)
-        + [x86.Jmp(lbl_start), x86.Label(lbl_end)]
-    )
-
-
-def _free_if_labels():
-    _free_if_labels.ctr += 1
-    suffix = '_label_{}'.format(_free_if_labels.ctr)
-    return 'else' + suffix, 'fi' + suffix
-
-
-_free_if_labels.ctr = 0
-
-
-def _free_while_labels():
-    _free_while_labels.ctr += 1
-    suffix = '_label_{}'.format(_free_while_labels.ctr)
-    return 'while' + suffix, 'end' + suffix
-
-
-_free_while_labels.ctr = 0
+def _block_label(func_name, block):
+    # labels are global symbols: prefix them with the function's name
+    return '{}.bb{}'.format(func_name, block.index)
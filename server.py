@@ -0,0 +1,140 @@
+import json
+import os
+import signal
+import socket
+import socketserver
+
+from cache import compiler_fingerprint
+
+
+REQUEST_TIMEOUT = 60  # seconds
+
+
+class CompileServerError(Exception):
+    pass
+
+
+def default_socket():
+    return os.environ.get('PYYC_SOCKET') or os.path.join(
+        os.environ.get('XDG_RUNTIME_DIR') or '/tmp',
+        'pyyc-{}.sock'.format(os.getuid())
+    )
+
+
+def request_compile(
+    source, path=None, jobs=1, cache=None, regalloc='graph',
+    timeout=REQUEST_TIMEOUT
+):
+    # returns the assembly and the statistics of the functions (as pycompile
+    # gives them), or None when no server of the user is listening on path,
+    # when it runs another version of the compiler than the one on disk, or
+    # when it takes longer than timeout seconds (e.g. busy with another
+    # compile), or when its reply is garbled (e.g. it died mid-send): the
+    # caller then compiles in-process
+    path = path or default_socket()
+    if not is_own_socket(path):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+            sock.sendall(json.dumps({
+                'source': source,
+                'jobs': jobs,
+                'regalloc': regalloc,
+                'cache': cache and [cache.path, cache.max_size, cache.root]
+            }).encode())
+            sock.shutdown(socket.SHUT_WR)
+            response = json.loads(_recv_all(sock).decode())
+        except (FileNotFoundError, ConnectionError, socket.timeout,
+                ValueError):
+            return None
+
+    if not isinstance(response, dict):
+        return None
+    if response.get('fingerprint') != compiler_fingerprint():
+        return None
+    if 'error' in response:
+        raise CompileServerError(response['error'])
+    return response['assembly'], response['stats']
+
+
+def is_own_socket(path):
+    # any user can create the socket first in a shared directory (e.g. /tmp)
+    # and answer with assembly of their choosing
+    try:
+        return os.stat(path).st_uid == os.getuid()
+    except FileNotFoundError:
+        return False
+
+
+def is_listening(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+    return True
+
+
+def _recv_all(sock):
+    return b''.join(iter(lambda: sock.recv(1 << 16), b''))
+
+
+class CompileHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        from cache import CompileCache
+        from pipeline import pycompile
+
+        self.request.settimeout(self.server.timeout)
+        try:
+            request = json.loads(_recv_all(self.request).decode())
+            cache = request.get('cache')
+            stats = []
+            response = {'assembly': str(pycompile(
+                request['source'],
+                jobs=request.get('jobs', 1),
+                regalloc=request.get('regalloc', 'graph'),
+                cache=cache and CompileCache(*cache),
+                stats=stats
+            )), 'stats': stats}
+        except Exception as e:
+            response = {'error': "{}: {}".format(e.__class__.__name__, e)}
+        response['fingerprint'] = self.server.fingerprint
+        try:
+            self.request.sendall(json.dumps(response).encode())
+        except ConnectionError:
+            pass  # the client timed out, or only checked that we listen
+
+
+def serve(path=None, timeout=60):
+    # requests are handled one at a time: pycompile resets the module-level
+    # name counters, so each request gets the same output as a fresh process
+    path = path or default_socket()
+    if os.path.exists(path) and not is_own_socket(path):
+        raise CompileServerError(
+            "{} belongs to another user".format(path)
+        )
+    elif is_listening(path):
+        raise CompileServerError(
+            "a compile server is already listening on {}".format(path)
+        )
+    elif os.path.exists(path):
+        os.unlink(path)  # stale socket of a dead server
+
+    # of the compiler as imported now, whatever later edits the files on disk
+    fingerprint = compiler_fingerprint()
+    import pipeline  # noqa: F401 (pay the import cost once, up front)
+
+    server = socketserver.UnixStreamServer(path, CompileHandler)
+    server.timeout = timeout
+    server.fingerprint = fingerprint
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
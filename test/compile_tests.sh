@@ -8,15 +8,23 @@ EXECUTABLE_DIR='executable'
 
 mkdir -p "$ASSEMBLY_DIR" "$EXECUTABLE_DIR"
 
+tests=()
+sources=()
 for test in `ls $TEST_SCRIPT_DIR`; do
 
   if [[ $# -ne 0 && " $@" != *" ${test%.py}"* ]]; then
     continue
   fi
 
-  test="${test%.py}"
+  tests+=("${test%.py}")
+  sources+=("$TEST_SCRIPT_DIR/$test")
 
-  ../pyyc "$TEST_SCRIPT_DIR/$test.py" -o "$ASSEMBLY_DIR/$test.s"
+done
+
+# compile all the tests with a single (parallel) batch run of the compiler
+../pyyc "${sources[@]}" --output-dir "$ASSEMBLY_DIR"
+
+for test in "${tests[@]}"; do
 
   gcc -m32 -g -lm "$ASSEMBLY_DIR/$test.s" "../runtime/libpyyruntime.a" -o "$EXECUTABLE_DIR/$test"
 
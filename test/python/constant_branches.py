@@ -0,0 +1,23 @@
+x = 3
+y = input() if x == 3 else x + [1]
+print(y + x)
+
+a = 1 if x < 2 else x + 10
+print(a)
+
+n = input()
+z = 4 if n > 0 else n
+print(z + 1)
+
+b = True if n == 2 else False
+c = 7 if b else 7
+print(c + n)
+
+f = lambda k: k + 1 if k == 0 else k + -1 if False else k
+print(f(0))
+print(f(n))
+
+w = 5 if not n else 0
+print(w)
+print(w + x + a)
+print(x if n == x else [x] if n < 0 else x + a)
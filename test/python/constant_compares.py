@@ -0,0 +1,17 @@
+x = input()
+print(1 if 3 < x else 0)
+print(1 if 3 > x else 0)
+print(1 if 3 <= x else 0)
+print(1 if 3 >= x else 0)
+print(1 if 3 == x else 0)
+print(1 if 3 != x else 0)
+
+n = 0
+while 10 > n + x:
+    n = n + 1
+print(n)
+
+m = 0
+while -5 < x + m and 0 != m + 4:
+    m = m + -1
+print(m)
@@ -0,0 +1,45 @@
+n = input()
+i = 0
+x = 1
+k = 2
+while i < n:
+    print(x)
+    x = x + 1
+    k = 2
+    i = i + 1
+print(x)
+print(k)
+
+j = 5
+s = 0
+while j != 0:
+    s = s + j
+    j = j + -1
+print(s)
+
+t = 0
+u = 3
+while t < 3:
+    v = u
+    u = 4 if t == 1 else u
+    print(v + u)
+    t = t + 1
+
+def count(m):
+    c = 0
+    d = 10
+    while c < m:
+        d = d + -c
+        c = c + 1
+    return d
+
+print(count(n))
+print(count(0))
+
+e = 0
+while e < 2:
+    f = 0
+    while f < e + 1:
+        f = f + 1
+    print(f)
+    e = e + 1
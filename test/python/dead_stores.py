@@ -0,0 +1,39 @@
+def noisy(a):
+    print(a)
+    return a + 1
+
+def g(a):
+    t = noisy(a)
+    t = a + 2
+    return t
+
+n = input()
+x = n + 1
+y = x + 2 if n > 0 else n
+print(y)
+
+d = input()
+print(input())
+
+z = 5
+z = input()
+print(z)
+
+w = n + 3
+w = n + 4 if n == 1 else w
+print(w)
+
+print(g(n))
+
+v = [n, n]
+unused = v[0]
+i = 0
+q = 0
+while i < 3:
+    q = i + n
+    r = q + 1
+    i = i + 1
+print(q)
+print(i)
+unused = noisy(7)
+e = noisy(8) if n > 0 else 0
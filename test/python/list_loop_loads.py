@@ -0,0 +1,26 @@
+l = [input(), input(), input(), input()]
+
+i = 0
+s = 0
+while i < len(l):
+    s = s + l[i] + l[i]
+    i = i + 1
+print(s)
+
+i = 0
+while i < len(l):
+    j = i
+    a = l[i]
+    b = l[j]
+    print(a + b)
+    print([l[i], l[j], l[i]])
+    i = i + 1
+
+m = [l, [1, 2]]
+i = 0
+while i < len(m):
+    k = 0
+    while k < len(m[i]):
+        print(m[i][k])
+        k = k + 1
+    i = i + 1
@@ -0,0 +1,35 @@
+def walk(l, m):
+    i = 0
+    while i < len(l):
+        print(l[i])
+        l = m if i == 1 else l
+        i = i + 1
+    return i
+
+
+print(walk([1, 2, 3], [10, 20, 30, 40, 50]))
+print(walk([4, 5, 6, 7], [8, 9]))
+
+l = [input(), input(), input()]
+m = [7, 8, 9, 10, 11]
+k = input()
+i = 0
+while i < len(l):
+    print(l[i])
+    l = m if i == k else l
+    i = i + 1
+print(i)
+
+i = 0
+while i < len(m):
+    m[i] = m[i] + i
+    print(m[i])
+    i = i + 1
+
+n = [1, 2]
+i = 0
+while i < len(n):
+    print(n[i])
+    n = n + [i] if i < 2 else n
+    i = i + 1
+print(n)
@@ -0,0 +1,38 @@
+l = [input(), input(), input(), input(), input()]
+
+i = 0
+while i < len(l):
+    print(l[i])
+    i = i + 2
+
+i = 1
+while i < len(l):
+    print(l[i])
+    i = i + True
+
+i = True
+while i < len(l):
+    print(l[i])
+    i = i + 1
+
+i = -2
+while i < len(l):
+    print(l[i])
+    i = i + 1
+
+i = input()
+while i < len(l):
+    print(l[i])
+    i = i + 1
+
+i = 0
+while i < len(l):
+    print(l[i])
+    i = i + 3
+    i = i + -2
+
+i = 0
+while i < len(l):
+    print(l[i + 1] if i + 1 < len(l) else l[i])
+    print(l[-1 + -i])
+    i = i + 1
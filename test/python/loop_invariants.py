@@ -0,0 +1,49 @@
+def inc(a):
+    return a + 1
+
+n = input()
+x = input()
+
+i = 0
+s = 0
+while i < n:
+    s = s + (x + 1)
+    i = i + 1
+print(s)
+
+i = 0
+s = 0
+while i < n:
+    s = s + (x + 1)
+    x = x + i
+    i = i + 1
+print(s)
+
+i = 0
+t = 0
+while i < n:
+    t = x + 2
+    t = t + i
+    i = i + 1
+print(t)
+
+l = [x, n]
+i = 0
+while i < len(l):
+    print(l[i])
+    i = i + 1
+
+i = 0
+while i < len(l) and i < n + 3:
+    l = l + [i]
+    i = i + 1
+print(l)
+
+f = inc
+i = 0
+s = 0
+while i < n:
+    s = f(s)
+    f = (lambda a: a + -1) if i == 1 else f
+    i = i + 1
+print(s)
@@ -0,0 +1,36 @@
+n = 0
+x = 0
+while n < 4:
+    x = True if n == 2 else x + 1
+    print(x)
+    n = n + 1
+print(x)
+
+def f(n):
+    x = input()
+    while n < 5:
+        x = [x] if n == 1 else (x == 1 if n == 3 else n)
+        print(x)
+        n = n + 1
+    return x
+
+print(f(input()))
+
+b = True
+k = 0
+while k < 3 + b:
+    k = k + b
+    print(k)
+
+y = input()
+z = y == 1
+while z == False:
+    print(y)
+    y = y + 1
+    z = y == 3 or not y < 3
+print(z)
+
+c = 0
+while c < 6:
+    c = c + 1 + (c == 1)
+    print(1 if c < 3 and c != 2 else (True if not c == 4 or c < 0 else c))
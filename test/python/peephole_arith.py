@@ -0,0 +1,13 @@
+x = input()
+print(x + False)
+print(False + x)
+print(x + (3 < 2))
+
+a = x + 1 + 2
+print(a)
+b = (x + 3) + -1
+print(b)
+
+t = not x
+print(t + t)
+print(-(-x))
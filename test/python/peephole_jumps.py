@@ -0,0 +1,11 @@
+x = input()
+y = input()
+z = x if y else x
+print(z)
+w = y if x else y
+print(w)
+
+i = 0
+while i != x:
+    i = i + 1 if i != y else i + 1
+print(i)
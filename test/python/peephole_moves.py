@@ -0,0 +1,18 @@
+def f(a):
+    return a + 1
+
+x = input()
+y = x
+x = -input()
+z = f(input())
+print(x + y + z)
+
+a = input()
+b = a
+a = input()
+print(a + b)
+
+c = input()
+d = c + 1
+e = d
+print(d + e + c)
@@ -0,0 +1,20 @@
+def noisy(a):
+    print(a)
+    return a
+
+x = input()
+print(1 if x and input() else 0)
+print(1 if x or input() else 0)
+print(1 if not x and noisy(2) else 0)
+print(1 if not (x or noisy(3)) else 0)
+print(1 if (x == 0 or noisy(4)) and not noisy(0) else 0)
+
+n = 0
+while input() and not input():
+    n = n + 1
+print(n)
+
+i = 0
+while i < 3 and noisy(i + 10) or noisy(0):
+    i = i + 1
+print(i)
@@ -0,0 +1,6 @@
+def f(n):
+    m = n + -1
+    return 0 if n == 0 else f(m) + f(0) + n
+
+
+print(f(input()))
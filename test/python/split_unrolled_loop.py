@@ -0,0 +1,19 @@
+def f(x):
+    y = x + input()
+    i = 0
+    while i < 4:
+        x = x + y + y + x
+        y = x
+        print(y)
+        i = i + 1
+    z = x + y + y
+    j = 0
+    while j < 3:
+        x = z + input() + y
+        x = y
+        x = y + y + z + input()
+        j = j + 1
+    return x + y + z
+
+
+print(f(input()))
@@ -0,0 +1,37 @@
+i = 0
+s = 0
+while i < 3:
+    s = s + i
+    i = i + True
+print(s)
+
+t = [1, 2]
+k = 0
+while k < 4:
+    print(len(t))
+    t = t + [k]
+    k = k + 1
+print(t)
+
+a = input()
+j = 0
+while j < 3:
+    a = a + j if j != 1 else -a
+    j = j + 1
+print(a)
+
+l = [input(), input()]
+j = 0
+while j < 2:
+    print(l[j] + len(l))
+    l = [j, j] if j == 0 else l
+    j = j + 1
+print(l)
+
+d = {}
+j = 0
+while j < 3:
+    d[j] = j == 1
+    j = j + 1
+print(d[0])
+print(d[1])
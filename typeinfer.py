@@ -0,0 +1,302 @@
+import ast
+
+import constants as C
+import extendedast as ext
+
+
+# Flow-sensitive type inference over the explicated body of a function: the
+# type of a value is the set of tags it can have at run time (int, bool or
+# big). Names get the type of what they were last assigned, the branches of an
+# if expression are joined, and loops iterate to a fixpoint from the types
+# they are entered with. The tag tests explicate emits whose outcome is then
+# known are removed along with the branches never taken (the TypeConflict
+# ones, mostly), and the arithmetic and comparisons of values of one known
+# tag work on the tagged values directly, without untagging and retagging.
+
+ANY = frozenset((C.T_INT, C.T_BOOL, C.T_BIG))
+INT = frozenset((C.T_INT,))
+BOOL = frozenset((C.T_BOOL,))
+BIG = frozenset((C.T_BIG,))
+
+BOTH = frozenset((True, False))
+
+# of the builtins that return a tagged value
+BUILTIN_TYPES = {
+    'input': INT,
+    'len': INT,
+}
+
+
+def infer_types(body):
+    inference = TypeInference()
+    inference.evaluate_body(body, {})
+    remover = TagCheckRemover(inference)
+    return [remover.visit(s) for s in body]
+
+
+class TypeInference:
+
+    def __init__(self):
+        self.loops = {}  # While: the types at its test, and after it
+        # joined over every time a node was evaluated
+        self.taken = {}  # IfExp: the outcomes of its test
+        self.untagged = {}  # UnTag: the types of its expression
+        self.bound = {}  # node: the names its Lets bind
+
+    def evaluate_body(self, stmts, env):
+        for s in stmts:
+            self.evaluate(s, env)
+
+    def evaluate(self, node, env):
+        # the type of node, updating env (name -> type) with its assignments
+        fname = 'evaluate_{}'.format(node.__class__.__name__)
+        return getattr(self, fname, self.evaluate_default)(node, env)
+
+    def evaluate_default(self, node, env):
+        for _, child in ast.iter_fields(node):
+            if isinstance(child, ast.AST):
+                self.evaluate(child, env)
+            elif isinstance(child, list):
+                for c in child:
+                    if isinstance(c, ast.AST):
+                        self.evaluate(c, env)
+        return ANY  # or untagged
+
+    def evaluate_Assign(self, assign, env):
+        t = self.evaluate(assign.value, env)
+        for target in assign.targets:
+            if isinstance(target, ast.Name):
+                env[target.id] = t
+            else:
+                self.evaluate(target, env)
+        return t
+
+    def evaluate_While(self, whl, env):
+        # from where the last evaluation of the loop (in an outer one) got,
+        # where nothing changed since
+        head, exit_env = self.loops.get(whl, (None, None))
+        if head is not None:
+            head = join([head, env])
+            if head == self.loops[whl][0]:
+                env.clear()
+                env.update(exit_env)
+                return ANY
+        else:
+            head = dict(env)
+
+        while True:
+            exit_env = dict(head)
+            outcomes = self.evaluate_test(whl.test, exit_env)
+            if True not in outcomes:
+                break
+            body_env = dict(exit_env)
+            self.evaluate_body(whl.body, body_env)
+            new_head = join([head, body_env])
+            if new_head == head:
+                break
+            head = new_head
+
+        self.loops[whl] = head, exit_env
+        env.clear()
+        env.update(exit_env)
+        return ANY
+
+    def evaluate_Let(self, let, env):
+        env[let.name.id] = self.evaluate(let.expr, env)
+        return self.evaluate(let.body, env)
+
+    def evaluate_Name(self, name, env):
+        return env.get(name.id, ANY)
+
+    def evaluate_IfExp(self, ifexp, env):
+        # in place when only one branch can be taken; else each branch starts
+        # from env with the names it can bind (in its Lets) reset, and only
+        # these are joined: env can be as large as the function
+        outcomes = self.evaluate_test(ifexp.test, env)
+        self.taken[ifexp] = self.taken.get(ifexp, frozenset()) | outcomes
+        if outcomes != BOTH:
+            for outcome, branch in ((True, ifexp.body), (False, ifexp.orelse)):
+                if outcome in outcomes:
+                    return self.evaluate(branch, env)
+            return frozenset()
+
+        names = self.bound_names(ifexp)
+        before = dict((n, env[n]) for n in names if n in env)
+        t, envs = frozenset(), []
+        for branch in (ifexp.body, ifexp.orelse):
+            branch_type = self.evaluate(branch, env)
+            if branch_type:  # else it never returns
+                t |= branch_type
+                envs.append(dict((n, env[n]) for n in names if n in env))
+            for n in names:
+                env.pop(n, None)
+            env.update(before)
+        if envs:
+            for n in names:
+                env.pop(n, None)
+            env.update(join(envs))
+        return t
+
+    def bound_names(self, node):
+        # the names the Lets in node bind
+        names = self.bound.get(node)
+        if names is None:
+            names = set()
+            if isinstance(node, ext.Let):
+                names.add(node.name.id)
+            for child in ast.iter_child_nodes(node):
+                names |= self.bound_names(child)
+            self.bound[node] = names
+        return names
+
+    def evaluate_test(self, test, env):
+        # the outcomes test can have
+        outcomes = self.tag_test(test, env)
+        if outcomes is None:
+            self.evaluate(test, env)
+            return BOTH
+        return outcomes
+
+    def tag_test(self, test, env):
+        # the outcomes of a test only comparing tags, None for other tests
+        if isinstance(test, ext.CmpEq) and isinstance(test.left, ext.GetTag) \
+                and isinstance(test.right, ext.Const):
+            expr = test.left.expr
+            if isinstance(expr, (ast.Name, ext.Name)):
+                tags = env.get(expr.id, ANY)
+            elif isinstance(expr, ext.Tag):
+                # the expression is only computed for its tag here (what it
+                # binds are temporaries of its Lets, unused elsewhere)
+                self.evaluate(expr, env)
+                tags = {expr.tag}
+            else:
+                return None
+            return frozenset(
+                (tag == test.right.value) != test.negated for tag in tags
+            )
+
+        elif isinstance(test, ast.BoolOp):
+            values = [self.tag_test(v, env) for v in test.values]
+            if None in values:
+                return None
+            elif not all(values):
+                return frozenset()
+            # And is False as soon as one is, Or True
+            decisive = isinstance(test.op, ast.Or)
+            outcomes = set()
+            if any(decisive in v for v in values):
+                outcomes.add(decisive)
+            if all((not decisive) in v for v in values):
+                outcomes.add(not decisive)
+            return frozenset(outcomes)
+
+        return None
+
+    def evaluate_Tag(self, tag, env):
+        self.evaluate(tag.expr, env)
+        return frozenset((tag.tag,))
+
+    def evaluate_UnTag(self, untag, env):
+        t = self.evaluate(untag.expr, env)
+        self.untagged[untag] = self.untagged.get(untag, frozenset()) | t
+        return ANY
+
+    def evaluate_TypeConflict(self, tc, env):
+        self.evaluate_default(tc, env)
+        return frozenset()  # aborts
+
+    def evaluate_Call(self, call, env):
+        self.evaluate_default(call, env)
+        if isinstance(call.func, ast.Name):
+            return BUILTIN_TYPES.get(call.func.id, ANY)
+        return ANY
+
+    def evaluate_Num(self, num, env):
+        return INT
+
+    def evaluate_NameConstant(self, nc, env):
+        return BOOL
+
+    def evaluate_List(self, lst, env):
+        self.evaluate_default(lst, env)
+        return BIG
+
+    evaluate_Dict = evaluate_Closure = evaluate_List
+
+
+def join(envs):
+    # a name missing from one of them can be anything there (and is left out)
+    joined = {}
+    for name in set().union(*envs):
+        t = frozenset().union(*(env.get(name, ANY) for env in envs))
+        if t != ANY:
+            joined[name] = t
+    return joined
+
+
+class TagCheckRemover(ast.NodeTransformer):
+
+    def __init__(self, inference):
+        self.inference = inference
+
+    def visit_IfExp(self, ifexp):
+        ifexp = self.generic_visit(ifexp)
+        taken = self.inference.taken.get(ifexp)
+        if taken == {True}:
+            return ifexp.body
+        elif taken == {False}:
+            return ifexp.orelse
+        return ifexp
+
+    def visit_Tag(self, tag):
+        tag = self.generic_visit(tag)
+        if tag.tag != C.T_INT:
+            return tag
+
+        # a tagged int is its value times 4, and so are sums and negations
+        e = tag.expr
+        if isinstance(e, ast.BinOp) and isinstance(e.op, ast.Add) and \
+                self.tagged_as(e.left, INT) and self.tagged_as(e.right, INT):
+            return ast.copy_location(
+                ast.BinOp(e.left.expr, ast.Add(), e.right.expr), tag
+            )
+        elif isinstance(e, ast.UnaryOp) and isinstance(e.op, ast.USub) and \
+                self.tagged_as(e.operand, INT):
+            return ast.copy_location(
+                ast.UnaryOp(ast.USub(), e.operand.expr), tag
+            )
+        return tag
+
+    def visit_UnTag(self, untag):
+        untag = self.generic_visit(untag)
+        # a bool is 0 or 1
+        if untag.tag == C.T_INT and isinstance(untag.expr, ext.Tag) and \
+                untag.expr.tag == C.T_BOOL:
+            return untag.expr.expr
+        return untag
+
+    def visit_CmpEq(self, cmp):
+        cmp = self.generic_visit(cmp)
+        # tagging with the same tag keeps values (in)equal and ordered
+        left, right = cmp.left, cmp.right
+        for tag in (C.T_INT, C.T_BOOL):
+            if not self.tagged_as(left, frozenset((tag,))):
+                continue
+            elif self.tagged_as(right, frozenset((tag,))):
+                return ast.copy_location(
+                    type(cmp)(left.expr, right.expr, cmp.negated), cmp
+                )
+            elif isinstance(right, ext.Const) and \
+                    isinstance(right.value, int):
+                tagged = ext.Const((right.value << C.TAG_SHIFT) | tag)
+                return ast.copy_location(
+                    type(cmp)(left.expr, tagged, cmp.negated), cmp
+                )
+        return cmp
+
+    visit_CmpLt = visit_CmpEq
+
+    def tagged_as(self, node, t):
+        # whether node untags as an int what only has the tags of t
+        return isinstance(node, ext.UnTag) and node.tag == C.T_INT and \
+            self.inference.untagged.get(node) == t
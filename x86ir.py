@@ -1,4 +1,5 @@
 
+import operator
 import textwrap
 from collections import namedtuple
 
@@ -63,6 +64,19 @@ def X86Op(op, reg_modifier=None, read_args=None, written_args=None):
 If = namedtuple('If', ['test', 'body', 'orelse'])
 While = namedtuple('While', ['tasm', 'test', 'body'])
 
+# The tests of If and While are conditions: a value (true if not 0), a
+# Compare of two, or a Choice between two conditions by a third. The
+# conditions of a Choice are (statements computing it, condition) pairs.
+# build_cfg lowers them to jumps.
+Compare = namedtuple('Compare', ['cc', 'left', 'right'])  # left cc right
+Choice = namedtuple('Choice', ['test', 'body', 'orelse'])
+
+
+class Flags(namedtuple('Flags', ['cc'])):
+    # the test of a block branching on the flags of the cmpl ending it
+    def __repr__(self):
+        return "flags {}".format(self.cc)
+
 
 class Directive(namedtuple('Directive', ['name', 'args'])):
     def __str__(self):
@@ -85,9 +99,27 @@ And = X86Op('andl', read_args=[0, 1], written_args=[1])
 Or = X86Op('orl', read_args=[0, 1], written_args=[1])
 Xor = X86Op('xorl', read_args=[0, 1], written_args=[1])
 
+
+class Load(X86Op('movl', read_args=[1, 2], written_args=[3])):
+    # movl offset(base, index), dst: the index (None for none) in bytes, and
+    # base, index and dst in registers
+
+    def __str__(self):
+        return "    {} {}".format(self.op, self._operands())
+
+    def __repr__(self):
+        return "{} {}".format(self.op, self._operands())
+
+    def _operands(self):
+        offset, base, index, dst = self._reg_modded_args()
+        return "{}({}{}), {}".format(
+            offset or '', base, '' if index is None else ',{}'.format(index),
+            dst
+        )
+
+
 Cmp = X86Op('cmpl', read_args=[0, 1])
 Jmp = X86Op('jmp', read_args=[0])
-Je = X86Op('je', read_args=[0])
 
 
 def CmpResult(cmp):
@@ -107,7 +139,32 @@ Setne = CmpResult('ne')
 Setl = CmpResult('l')
 Setnl = CmpResult('nl')
 Setg = CmpResult('g')
-Setng = CmpResult('gl')
+Setng = CmpResult('ng')
+
+
+def CondJump(cc):
+    CondJump.jumps[cc] = X86Op('j' + cc, read_args=[0])
+    return CondJump.jumps[cc]
+
+
+CondJump.jumps = {}
+
+
+Je = CondJump('e')
+Jne = CondJump('ne')
+Jl = CondJump('l')
+Jnl = CondJump('nl')
+Jg = CondJump('g')
+Jng = CondJump('ng')
+
+# the condition codes of setX and jX: cmpl a, b then jl jumps if b < a
+CONDITIONS = {
+    'e': operator.eq, 'ne': operator.ne, 'l': operator.lt, 'nl': operator.ge,
+    'g': operator.gt, 'ng': operator.le
+}
+NEGATED_CC = {'e': 'ne', 'ne': 'e', 'l': 'nl', 'nl': 'l', 'g': 'ng', 'ng': 'g'}
+# with a and b swapped
+SWAPPED_CC = {'e': 'e', 'ne': 'ne', 'l': 'g', 'nl': 'ng', 'g': 'l', 'ng': 'nl'}
 
 Call = X86Op('call', read_args=[0])
 